@@ -0,0 +1,180 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+from fastapi.responses import StreamingResponse
+
+
+class Overloaded(Exception):
+    """Request shed before reaching vLLM; `reason` names the counter."""
+
+    def __init__(self, reason: str, retry_after_s: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class AdmissionController:
+    """Caps requests in flight to vLLM, with a bounded FIFO wait queue.
+
+    A request past `max_in_flight` waits for a slot until its deadline. It
+    is shed at once when the queue already holds `max_queue` requests, or
+    when the queue ahead of it would take longer than its deadline at the
+    recent service rate, instead of timing out after waiting for nothing.
+    """
+
+    def __init__(self, max_in_flight: int = 32, max_queue: int = 64):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        # Moving average of how long a request holds its slot
+        self._service_s = 0.0
+        self.reset()
+
+    def reset(self):
+        self.admitted = 0
+        self.queued = 0
+        self.max_queue_depth = 0
+        self.shed: dict[str, int] = {}
+        self._wait_s = 0.0
+
+    def count_shed(self, reason: str):
+        self.shed[reason] = self.shed.get(reason, 0) + 1
+
+    def _shed(self, reason: str, retry_after_s: float):
+        self.count_shed(reason)
+        raise Overloaded(reason, retry_after_s)
+
+    def expected_wait_s(self, position: int) -> float:
+        """Queue wait for the `position`-th waiter at the recent service rate."""
+        return position * self._service_s / self.max_in_flight
+
+    async def acquire(self, timeout_s: float):
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        depth = len(self._waiters)
+        if depth >= self.max_queue:
+            self._shed("queue_full", self.expected_wait_s(depth) or 1.0)
+        if self.expected_wait_s(depth + 1) > timeout_s:
+            self._shed("deadline", self.expected_wait_s(depth + 1))
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout_s)
+        except asyncio.TimeoutError:
+            # release() may have handed over the slot just as the wait ended
+            if not fut.done():
+                self._waiters.remove(fut)
+                self._shed("deadline", self.expected_wait_s(len(self._waiters)))
+        except asyncio.CancelledError:
+            # Client went away while queued: give back a slot it was handed
+            if fut.done():
+                self.release()
+            else:
+                self._waiters.remove(fut)
+            raise
+        self._wait_s += time.perf_counter() - t0
+        self.admitted += 1
+
+    def release(self, held_s: float | None = None):
+        if held_s is not None:
+            self._service_s = (
+                held_s if not self._service_s else 0.9 * self._service_s + 0.1 * held_s
+            )
+        # The slot passes straight to the oldest waiter
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "mean_queue_wait_ms": (
+                round(self._wait_s / self.queued * 1000, 1) if self.queued else 0.0
+            ),
+            "service_ms": round(self._service_s * 1000, 1),
+            "shed": dict(self.shed),
+        }
+
+
+class SlotStreamingResponse(StreamingResponse):
+    """Streaming response holding an admission slot, released exactly once.
+
+    The body generator may release early (as soon as vLLM is done) through
+    `release()`. Whatever happens to it, the slot is also released when the
+    response ends, including a client that disconnects before the generator
+    ever runs, where the generator's own `finally` never executes.
+    """
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    def release(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+class RateLimiter:
+    """Token bucket per client: `rate` requests/s, bursts up to `burst`.
+
+    Buckets of the least recently seen clients are dropped past
+    `max_clients`; a dropped client comes back with a full bucket.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self.limited = 0
+
+    def check(self, client: str) -> float:
+        """0 when `client` may proceed, else seconds until it has a token."""
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+            self.limited += 1
+        self._buckets[client] = (tokens, now)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_s": self.rate,
+            "burst": self.burst,
+            "clients": len(self._buckets),
+            "limited": self.limited,
+        }
+
+    def reset(self):
+        self.limited = 0
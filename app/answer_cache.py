@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+
+# Evict down to this fraction of the cap, so a full cache doesn't evict on
+# every store
+_EVICT_TO = 0.9
+# Hit times held in memory before they are written back without a store
+_MAX_TOUCHED = 1024
+
+
+def answer_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+class AnswerCache:
+    """Persistent exact-match answers: key -> (answer, sources) in SQLite.
+
+    The key is built by the caller from everything that decides the answer
+    (normalized question, k, index version, model, prompt hash), so a new
+    index or prompt simply stops matching old rows. Rows are evicted least
+    recently used first once they exceed `max_mb`. Hit times are kept in
+    memory and written back with the next store (or once `_MAX_TOUCHED`
+    pile up), so a lookup is usually one primary-key read.
+    """
+
+    def __init__(self, path: str, max_mb: float = 64):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._touched: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY,"
+            " question TEXT NOT NULL,"
+            " answer TEXT NOT NULL,"
+            " sources TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)"
+        )
+        self._bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM answers"
+        ).fetchone()[0]
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT answer, sources FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= _MAX_TOUCHED:
+                with self.conn:
+                    self._flush_touched()
+        return {"answer": row[0], "sources": json.loads(row[1])}
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return (
+                self.conn.execute(
+                    "SELECT 1 FROM answers WHERE key = ?", (key,)
+                ).fetchone()
+                is not None
+            )
+
+    def put(self, key: str, question: str, answer: str, sources: list[dict]):
+        sources_json = json.dumps(sources, ensure_ascii=False)
+        size = len(key) + len(question) + len(answer) + len(sources_json)
+        with self._lock, self.conn:
+            old = self.conn.execute(
+                "SELECT size FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                (key, question, answer, sources_json, size, time.time()),
+            )
+            self._bytes += size - (old[0] if old else 0)
+            self._flush_touched()
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _flush_touched(self):
+        if self._touched:
+            self.conn.executemany(
+                "UPDATE answers SET last_used = ? WHERE key = ?",
+                [(t, k) for k, t in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        target = self.max_bytes * _EVICT_TO
+        rows = self.conn.execute(
+            "SELECT key, size FROM answers ORDER BY last_used"
+        ).fetchall()
+        doomed = []
+        for key, size in rows:
+            if self._bytes <= target:
+                break
+            doomed.append((key,))
+            self._bytes -= size
+        self.conn.executemany("DELETE FROM answers WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        return {
+            "entries": entries,
+            "size_mb": round(self._bytes / 1024 / 1024, 3),
+            "max_mb": round(self.max_bytes / 1024 / 1024, 3),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def close(self):
+        with self._lock, self.conn:
+            self._flush_touched()
+        self.conn.close()
+
+
+class QueryLog:
+    """Append-only JSONL of served requests, read back to find hot questions.
+
+    Past `max_mb` the file is renamed to `<path>.1`, replacing the previous
+    one, so the log keeps between one and two files' worth of requests.
+    Several workers can share the path; a worker still appending to a
+    file another one rotated follows it on its next append.
+    """
+
+    def __init__(self, path: str, max_mb: float = 64):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def append(self, request: dict):
+        with self._lock:
+            self._file.write(json.dumps(request, ensure_ascii=False) + "\n")
+            if os.fstat(self._file.fileno()).st_size > self.max_bytes:
+                self._rotate()
+
+    def _rotate(self):
+        try:
+            live = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            live = None
+        if live == os.fstat(self._file.fileno()).st_ino:
+            os.replace(self.path, f"{self.path}.1")
+        self._file.close()
+        self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+
+    def most_frequent(self, n: int, key, window: int = 100_000) -> tuple[list, int]:
+        """The `n` most frequent requests among the last `window`, one per
+        `key(request)`, most frequent first, and the number of lines skipped.
+
+        A line is skipped when it is not JSON (e.g. cut short by a crash) or
+        `key` raises ValueError on it (e.g. a request of an older schema).
+        """
+        recent = deque(maxlen=window)
+        for path in (f"{self.path}.1", self.path):
+            if Path(path).exists():
+                with open(path, encoding="utf-8") as f:
+                    recent.extend(line for line in f if line.strip())
+        counts, first, skipped = Counter(), {}, 0
+        for line in recent:
+            try:
+                request = json.loads(line)
+                k = key(request)
+            except (ValueError, TypeError):
+                skipped += 1
+                continue
+            counts[k] += 1
+            first.setdefault(k, request)
+        return [first[k] for k, _ in counts.most_common(n)], skipped
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,146 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _bucket(n: int) -> int:
+    """Power-of-two histogram bucket (upper bound) for n >= 0."""
+    b = 1
+    while b < n:
+        b *= 2
+    return b if n else 0
+
+
+def run_isolated(rows: list[int], run) -> list:
+    """`run(rows)` for a group of items, one result per row. If it raises,
+    the rows are retried one by one, so an exception only stands in for
+    the items that fail on their own."""
+    try:
+        return run(rows)
+    except Exception as e:
+        if len(rows) == 1:
+            return [e]
+    out = []
+    for i in rows:
+        try:
+            out.extend(run([i]))
+        except Exception as e:
+            out.append(e)
+    return out
+
+
+class MicroBatcher:
+    """Coalesces concurrent calls into batches run on a worker thread.
+
+    `fn` takes a list of items and returns one result per item; an
+    exception returned in an item's slot fails only that item's call. The first
+    queued item opens a batch, which closes after `max_wait_ms` or at
+    `max_batch` items; while a batch runs, new items queue up and go out
+    together in the next one. The event loop only ever awaits.
+    """
+
+    def __init__(self, fn, max_batch: int = 32, max_wait_ms: float = 2.0, name=""):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_ms / 1000
+        self.name = name
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self.reset()
+
+    def reset(self):
+        self.batches = 0
+        self.items = 0
+        self.busy_s = 0.0
+        self.batch_sizes: dict[int, int] = {}
+        self.queue_depths: dict[int, int] = {}
+
+    def start(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        while self._queue is not None and not self._queue.empty():
+            self._queue.get_nowait()[1].cancel()
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, item):
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, fut))
+        return await fut
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Whatever is already waiting rides along, up to max_batch
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Items still waiting once this batch is taken
+            depth = _bucket(self._queue.qsize())
+            self.queue_depths[depth] = self.queue_depths.get(depth, 0) + 1
+            size = _bucket(len(batch))
+            self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+            self.batches += 1
+            self.items += len(batch)
+
+            batch = [(item, fut) for item, fut in batch if not fut.cancelled()]
+            if not batch:
+                continue
+            t0 = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, self.fn, [item for item, _ in batch]
+                )
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            finally:
+                self.busy_s += time.perf_counter() - t0
+
+            for (_, fut), result in zip(batch, results):
+                if fut.done():
+                    continue
+                if isinstance(result, Exception):
+                    fut.set_exception(result)
+                else:
+                    fut.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": (
+                round(self.items / self.batches, 2) if self.batches else 0.0
+            ),
+            "busy_s": round(self.busy_s, 2),
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            # power-of-two bucket upper bound -> number of batches
+            "batch_size_hist": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+            "queue_depth_hist": {
+                str(k): v for k, v in sorted(self.queue_depths.items())
+            },
+        }
@@ -7,13 +7,22 @@ class MetricsCollector:
         self._latencies: list[float] = []
         self._start_time = time.time()
         self._request_count = 0
+        # Streamed answers only: time to first token, gaps between tokens
+        self._ttft: list[float] = []
+        self._itl: list[float] = []
 
     def record(self, latency_ms: float):
         self._latencies.append(latency_ms)
         self._request_count += 1
 
+    def record_stream(self, ttft_ms: float, itl_ms: list[float]):
+        self._ttft.append(ttft_ms)
+        self._itl.extend(itl_ms)
+
     def summary(self) -> dict:
         lats = np.array(self._latencies) if self._latencies else np.array([0])
+        ttft = np.array(self._ttft) if self._ttft else np.array([0])
+        itl = np.array(self._itl) if self._itl else np.array([0])
         elapsed = time.time() - self._start_time
         return {
             "total_requests": self._request_count,
@@ -22,9 +31,85 @@ class MetricsCollector:
             "mean_ms": round(float(np.mean(lats)), 1),
             "throughput_qps": round(self._request_count / max(elapsed, 1), 2),
             "uptime_s": round(elapsed, 1),
+            "streamed_requests": len(self._ttft),
+            "ttft_p50_ms": round(float(np.percentile(ttft, 50)), 1),
+            "ttft_p99_ms": round(float(np.percentile(ttft, 99)), 1),
+            "itl_p50_ms": round(float(np.percentile(itl, 50)), 1),
+            "itl_p99_ms": round(float(np.percentile(itl, 99)), 1),
         }
 
     def reset(self):
         self._latencies.clear()
+        self._ttft.clear()
+        self._itl.clear()
         self._request_count = 0
         self._start_time = time.time()
+
+
+# vLLM prefix-cache counters (prompt tokens looked up / found in cache); the
+# second name is the one older vLLM releases export
+PREFIX_CACHE_COUNTERS = {
+    "queries": (
+        "vllm:prefix_cache_queries_total",
+        "vllm:gpu_prefix_cache_queries_total",
+    ),
+    "hits": ("vllm:prefix_cache_hits_total", "vllm:gpu_prefix_cache_hits_total"),
+}
+
+
+def parse_prefix_cache(text: str) -> dict[str, float]:
+    """Prefix-cache counters from a Prometheus exposition, summed over labels."""
+    names = {n: key for key, ns in PREFIX_CACHE_COUNTERS.items() for n in ns}
+    found: dict[str, dict[str, float]] = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name, _, rest = line.partition("{") if "{" in line else line.partition(" ")
+        if name not in names:
+            continue
+        value = rest.rpartition("}")[2] if "}" in rest else rest
+        per_name = found.setdefault(names[name], {})
+        per_name[name] = per_name.get(name, 0.0) + float(value.split()[0])
+    # Take the newer name when a release exports both
+    return {
+        key: next(found[key][n] for n in PREFIX_CACHE_COUNTERS[key] if n in found[key])
+        for key in PREFIX_CACHE_COUNTERS
+        if key in found
+    }
+
+
+class PrefixCacheMeter:
+    """vLLM prefix-cache hit rate since the last reset, in prompt tokens."""
+
+    def __init__(self):
+        self._base = {"queries": 0.0, "hits": 0.0}
+        self.warmup: dict | None = None
+
+    def stats(self, counters: dict[str, float] | None) -> dict:
+        out = {"warmup": self.warmup}
+        if not counters or "queries" not in counters:
+            out["available"] = False
+            return out
+        queries = counters["queries"] - self._base["queries"]
+        hits = counters.get("hits", 0.0) - self._base["hits"]
+        out.update(
+            {
+                "available": True,
+                "queried_tokens": int(queries),
+                "hit_tokens": int(hits),
+                "hit_rate": round(hits / queries, 4) if queries > 0 else 0.0,
+                "lifetime_hit_rate": (
+                    round(counters.get("hits", 0.0) / counters["queries"], 4)
+                    if counters["queries"] > 0
+                    else 0.0
+                ),
+            }
+        )
+        return out
+
+    def reset(self, counters: dict[str, float] | None):
+        if counters and "queries" in counters:
+            self._base = {
+                "queries": counters["queries"],
+                "hits": counters.get("hits", 0.0),
+            }
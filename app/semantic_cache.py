@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticCache:
+    """Answers keyed by query embedding, matched by cosine similarity.
+
+    A hit needs the same scope (k, filters, ...), the same index version and a
+    cached question within `threshold` cosine of the new one. Entries expire
+    after `ttl_s`, the least recently used is evicted past `max_size`, and a
+    new index version drops everything.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl_s: float = 3600, threshold=0.95):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.threshold = threshold
+        self.index_version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[int, dict] = OrderedDict()
+        self._next_id = 0
+        self._matrix = None
+        self._ids: list[int] = []
+        self._lock = threading.Lock()
+
+    def _check_version(self, index_version):
+        if index_version != self.index_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._matrix = None
+            self.index_version = index_version
+
+    def _expire(self, now: float):
+        expired = [i for i, e in self._entries.items() if now - e["t"] > self.ttl_s]
+        for i in expired:
+            del self._entries[i]
+        if expired:
+            self._matrix = None
+
+    def lookup(self, qvec: np.ndarray, index_version, scope) -> dict | None:
+        with self._lock:
+            self._check_version(index_version)
+            self._expire(time.time())
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._ids = list(self._entries)
+                self._matrix = np.stack([e["vec"] for e in self._entries.values()])
+
+            # Vectors are L2-normalized, so the dot product is the cosine
+            sims = self._matrix @ qvec
+            for j in np.argsort(-sims):
+                if sims[j] < self.threshold:
+                    break
+                entry = self._entries[self._ids[j]]
+                if entry["scope"] == scope:
+                    self._entries.move_to_end(self._ids[j])
+                    self.hits += 1
+                    return {
+                        "answer": entry["answer"],
+                        "sources": entry["sources"],
+                        "similarity": float(sims[j]),
+                    }
+
+            self.misses += 1
+            return None
+
+    def store(self, qvec: np.ndarray, index_version, scope, answer: str, sources):
+        with self._lock:
+            self._check_version(index_version)
+            self._entries[self._next_id] = {
+                "vec": np.asarray(qvec, dtype="float32"),
+                "scope": scope,
+                "answer": answer,
+                "sources": sources,
+                "t": time.time(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
@@ -1,94 +1,719 @@
+import asyncio
+import json
+import logging
+import math
+import os
 import time
 from contextlib import asynccontextmanager
+from typing import Literal
 
 import httpx
-from fastapi import FastAPI
-from pydantic import BaseModel
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
 
-from app.metrics import MetricsCollector
+from app.admission import (
+    AdmissionController,
+    Overloaded,
+    RateLimiter,
+    SlotStreamingResponse,
+)
+from app.answer_cache import AnswerCache, QueryLog, answer_key
+from app.batcher import MicroBatcher, run_isolated
+from app.metrics import MetricsCollector, PrefixCacheMeter, parse_prefix_cache
+from app.semantic_cache import SemanticCache
+from app.singleflight import SingleFlight
+from rag.context import DEFAULT_CONTEXT_TOKENS, DEFAULT_TOKENIZER, ContextPacker
 from rag.local_llm import SYSTEM_PROMPT
-from rag.retrieve import Retriever, format_context_from_results
+from rag.query_cache import QueryEmbeddingCache, normalize_query
+from rag.rerank import DEFAULT_MIN_SCORE, DEFAULT_RERANK_FETCH, CrossEncoderReranker
+from rag.retrieve import DEFAULT_CASCADE_FETCH, Retriever
+from rag.shards import ShardedRetriever, open_retriever
 
 VLLM_BASE = "http://localhost:8100/v1"
+VLLM_METRICS_URL = "http://localhost:8100/metrics"
+LLM_MODEL = DEFAULT_TOKENIZER
+MAX_TOKENS = 512
+# vLLM --max-model-len; the context budget never crowds out the answer
+MAX_MODEL_LEN = int(os.environ.get("RAG_MAX_MODEL_LEN", "8192"))
+# Prompt context in model tokens: merged, deduplicated chunks chosen by rank
+CONTEXT_TOKENS = int(os.environ.get("RAG_CONTEXT_TOKENS", str(DEFAULT_CONTEXT_TOKENS)))
+# Lay the chosen chunks out in chunk_id order, not rank order, so questions
+# retrieving overlapping chunks share vLLM prefix-cache blocks
+CANONICAL_CONTEXT = os.environ.get("RAG_CANONICAL_CONTEXT", "1") == "1"
+# Prefill the system prompt prefix once at startup
+PREFIX_WARMUP = os.environ.get("RAG_PREFIX_WARMUP", "1") == "1"
+INDEX_DIR = os.environ.get("RAG_INDEX_DIR", "data/vector_index")
+# Memory-map the index so uvicorn workers share page-cache pages
+INDEX_MMAP = os.environ.get("RAG_INDEX_MMAP", "1") == "1"
+# Resident-size cap for a --shard-by-ref index; cold version shards are evicted
+SHARD_MEMORY_MB = float(os.environ.get("RAG_SHARD_MEMORY_MB", "0")) or None
+# dense, lexical, hybrid or auto (identifier-heavy questions go lexical)
+RETRIEVAL_MODE = os.environ.get("RAG_RETRIEVAL_MODE", "dense")
+# Query encoder: torch, onnx or onnx-int8 (CPU), and its intra-op thread count
+EMBED_BACKEND = os.environ.get("RAG_EMBED_BACKEND", "torch")
+EMBED_THREADS = int(os.environ.get("RAG_EMBED_THREADS", "0")) or None
+# Small-model index over the same chunks (rag.build_index --model ...): its
+# candidates are re-scored against the main index's vectors
+CASCADE_DIR = os.environ.get("RAG_CASCADE_DIR") or None
+CASCADE_FETCH = int(os.environ.get("RAG_CASCADE_FETCH", str(DEFAULT_CASCADE_FETCH)))
+QUERY_CACHE_SIZE = int(os.environ.get("RAG_QUERY_CACHE_SIZE", "10000"))
+QUERY_CACHE_PATH = os.environ.get(
+    "RAG_QUERY_CACHE_PATH", "data/cache/query_embeddings.npz"
+)
+# Serve paraphrases of recently answered questions without calling vLLM
+SEMANTIC_CACHE = os.environ.get("RAG_SEMANTIC_CACHE", "1") == "1"
+SEMANTIC_CACHE_SIZE = int(os.environ.get("RAG_SEMANTIC_CACHE_SIZE", "1000"))
+SEMANTIC_CACHE_TTL_S = float(os.environ.get("RAG_SEMANTIC_CACHE_TTL_S", "3600"))
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("RAG_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+# Cross-encoder rerank: over-fetch, then forward only the chunks worth their
+# prefill tokens to vLLM
+RERANK = os.environ.get("RAG_RERANK", "0") == "1"
+RERANK_FETCH = int(os.environ.get("RAG_RERANK_FETCH", str(DEFAULT_RERANK_FETCH)))
+RERANK_MIN_SCORE = float(os.environ.get("RAG_RERANK_MIN_SCORE", str(DEFAULT_MIN_SCORE)))
+RERANK_MAX_CHARS = int(os.environ.get("RAG_RERANK_MAX_CHARS", "6000"))
+# Concurrent queries are encoded and searched together, off the event loop:
+# a batch closes after BATCH_MAX_WAIT_MS or at BATCH_MAX_SIZE queries
+BATCH_MAX_SIZE = int(os.environ.get("RAG_BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("RAG_BATCH_MAX_WAIT_MS", "2"))
+# Largest k a request may ask for; its n x k result arrays are built on the
+# shared search thread
+MAX_K = int(os.environ.get("RAG_MAX_K", "50"))
+# Identical questions in flight at the same time share one retrieval and
+# one generation
+SINGLE_FLIGHT = os.environ.get("RAG_SINGLE_FLIGHT", "1") == "1"
+# Exact-match answers on disk, checked before any retrieval; survives restarts
+ANSWER_CACHE = os.environ.get("RAG_ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_PATH = os.environ.get("RAG_ANSWER_CACHE_PATH", "data/cache/answers.sqlite")
+ANSWER_CACHE_MB = float(os.environ.get("RAG_ANSWER_CACHE_MB", "64"))
+# Every request is logged here; on startup the most frequent questions that
+# miss the answer cache are answered in the background
+QUERY_LOG_PATH = os.environ.get("RAG_QUERY_LOG", "data/cache/query_log.jsonl")
+QUERY_LOG_MB = float(os.environ.get("RAG_QUERY_LOG_MB", "64"))
+ANSWER_CACHE_WARMUP = int(os.environ.get("RAG_ANSWER_CACHE_WARMUP", "100"))
+# At most MAX_IN_FLIGHT generations go to vLLM; up to MAX_QUEUE more wait for
+# a slot, each for QUEUE_TIMEOUT_S at most. Past that, or when a request's
+# deadline can't be met, it gets a 503 instead of queueing inside vLLM
+MAX_IN_FLIGHT = int(os.environ.get("RAG_MAX_IN_FLIGHT", "32"))
+MAX_QUEUE = int(os.environ.get("RAG_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT_S = float(os.environ.get("RAG_QUEUE_TIMEOUT_S", "10"))
+# Deadline for requests that don't send deadline_ms; 504 once it passes
+REQUEST_TIMEOUT_S = float(os.environ.get("RAG_REQUEST_TIMEOUT_S", "60"))
+# Per-client token bucket keyed on the client address, 0 = off
+RATE_LIMIT = float(os.environ.get("RAG_RATE_LIMIT", "0"))
+RATE_BURST = float(os.environ.get("RAG_RATE_BURST", "10"))
+# Peers (e.g. a gateway) whose X-Client-Id header names the client; "*"
+# trusts every peer. Anyone else could pick a fresh id per request
+TRUSTED_PROXIES = {
+    p.strip() for p in os.environ.get("RAG_TRUSTED_PROXIES", "").split(",") if p.strip()
+}
 
 metrics = MetricsCollector()
-retriever: Retriever = None
+prefix_cache = PrefixCacheMeter()
+single_flight = SingleFlight()
+admission = AdmissionController(MAX_IN_FLIGHT, MAX_QUEUE) if MAX_IN_FLIGHT else None
+rate_limiter = RateLimiter(RATE_LIMIT, RATE_BURST) if RATE_LIMIT else None
+query_cache = QueryEmbeddingCache(maxsize=QUERY_CACHE_SIZE, path=QUERY_CACHE_PATH)
+semantic_cache = SemanticCache(
+    max_size=SEMANTIC_CACHE_SIZE,
+    ttl_s=SEMANTIC_CACHE_TTL_S,
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+)
+retriever: Retriever | ShardedRetriever = None
+reranker: CrossEncoderReranker | None = None
+packer: ContextPacker = None
 llm_client: httpx.AsyncClient = None
+answer_cache: AnswerCache | None = None
+query_log: QueryLog | None = None
+answer_warmup: dict | None = None
+
+logger = logging.getLogger(__name__)
+
+
+def _embed_batch(items: list[tuple]) -> list:
+    """(embedder, question) items; one encode per embedder."""
+    groups: dict[int, list[int]] = {}
+    for i, (embedder, _) in enumerate(items):
+        groups.setdefault(id(embedder), []).append(i)
+
+    out = [None] * len(items)
+    for rows in groups.values():
+        embedder = items[rows[0]][0]
+        vecs = run_isolated(
+            rows, lambda rs: list(embedder.encode_queries([items[i][1] for i in rs]))
+        )
+        for i, v in zip(rows, vecs):
+            out[i] = v
+    return out
+
+
+def _search_batch(items: list[tuple]) -> list:
+    """(shard, question, k, mode, qvec, cascade_qvec, filters) items; one
+    search per shard / k / mode / filters group."""
+    groups: dict[tuple, list[int]] = {}
+    for i, (shard, _, k, mode, _, _, filters) in enumerate(items):
+        key = (id(shard), k, mode, repr(sorted((filters or {}).items())))
+        groups.setdefault(key, []).append(i)
+
+    def search(rows: list[int]) -> list:
+        shard, _, k, mode, _, _, filters = items[rows[0]]
+        qvecs = cascade_qvecs = None
+        if mode != "lexical":
+            qvecs = np.stack([items[i][4] for i in rows])
+            if shard.cascade is not None:
+                cascade_qvecs = np.stack([items[i][5] for i in rows])
+        return shard.search_batch(
+            [items[i][1] for i in rows],
+            k=k,
+            mode=mode,
+            qvecs=qvecs,
+            fields=["chunk_id", "heading", "url", "urls", "text"],
+            filters=filters,
+            cascade_qvecs=cascade_qvecs,
+        )
+
+    out = [None] * len(items)
+    for rows in groups.values():
+        # A failing search fails its own request, not the whole batch
+        for i, r in zip(rows, run_isolated(rows, search)):
+            out[i] = r
+    return out
+
+
+def _messages(question: str, context: str) -> list[dict]:
+    # Stable to volatile: system prompt, retrieved context, then the question
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": f"Context:\n{context}\n\nQuestion: {question}\n\nAnswer:",
+        },
+    ]
+
+
+# Anything that changes the prompt or which chunks reach it; part of every
+# answer-cache key, so changing a setting never serves stale answers
+PROMPT_HASH = answer_key(
+    _messages("{question}", "{context}"),
+    CONTEXT_TOKENS,
+    CANONICAL_CONTEXT,
+    MAX_TOKENS,
+    RETRIEVAL_MODE,
+    RERANK and (RERANK_FETCH, RERANK_MIN_SCORE, RERANK_MAX_CHARS),
+    CASCADE_DIR and CASCADE_FETCH,
+)
+
+
+def _build_messages(question: str, results: list[dict]) -> list[dict]:
+    # Whatever the template and question take is left out of the context budget
+    overhead = packer.chat_tokens(_messages(question, ""))
+    budget = min(CONTEXT_TOKENS, MAX_MODEL_LEN - MAX_TOKENS - overhead)
+    context = packer.pack(results, budget=max(budget, 0), canonical=CANONICAL_CONTEXT)
+    return _messages(question, context)
+
+
+async def _warm_prefix():
+    """One-token completion of the question-free prompt, so the system prompt
+    blocks are in vLLM's prefix cache before the first request."""
+    t0 = time.perf_counter()
+    try:
+        resp = await llm_client.post(
+            "/chat/completions",
+            json={
+                "model": LLM_MODEL,
+                "messages": _messages("", ""),
+                "max_tokens": 1,
+                "temperature": 0,
+            },
+        )
+        resp.raise_for_status()
+        prefix_cache.warmup = {
+            "ok": True,
+            "prompt_tokens": resp.json()["usage"]["prompt_tokens"],
+            "ms": round((time.perf_counter() - t0) * 1000, 1),
+        }
+    except (httpx.HTTPError, KeyError) as e:
+        # vLLM not up yet: serving works, the first request pays the prefill
+        prefix_cache.warmup = {"ok": False, "error": repr(e)}
+
+
+async def _prefix_counters() -> dict | None:
+    try:
+        resp = await llm_client.get(VLLM_METRICS_URL, timeout=2.0)
+        resp.raise_for_status()
+    except httpx.HTTPError:
+        return None
+    return parse_prefix_cache(resp.text)
+
+
+embed_batcher = MicroBatcher(
+    _embed_batch, max_batch=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, name="embed"
+)
+search_batcher = MicroBatcher(
+    _search_batch,
+    max_batch=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    name="search",
+)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global retriever, llm_client
-    retriever = Retriever("data/vector_index")
+    global retriever, reranker, packer, llm_client, answer_cache, query_log
+    retriever = open_retriever(
+        INDEX_DIR,
+        memory_cap_mb=SHARD_MEMORY_MB,
+        mmap=INDEX_MMAP,
+        query_cache=query_cache,
+        mode=RETRIEVAL_MODE,
+        embed_backend=EMBED_BACKEND,
+        embed_threads=EMBED_THREADS,
+        cascade_dir=CASCADE_DIR,
+        cascade_fetch=CASCADE_FETCH,
+    )
+    if RERANK:
+        reranker = CrossEncoderReranker()
+    packer = ContextPacker(LLM_MODEL, budget=CONTEXT_TOKENS)
     llm_client = httpx.AsyncClient(base_url=VLLM_BASE, timeout=120.0)
+    if PREFIX_WARMUP:
+        await _warm_prefix()
+    if ANSWER_CACHE:
+        answer_cache = AnswerCache(ANSWER_CACHE_PATH, max_mb=ANSWER_CACHE_MB)
+    if QUERY_LOG_PATH:
+        query_log = QueryLog(QUERY_LOG_PATH, max_mb=QUERY_LOG_MB)
+    embed_batcher.start()
+    search_batcher.start()
+    warmup = None
+    if answer_cache and query_log and ANSWER_CACHE_WARMUP:
+        warmup = asyncio.create_task(_warm_answers())
     yield
+    if warmup is not None:
+        warmup.cancel()
+    await embed_batcher.stop()
+    await search_batcher.stop()
     await llm_client.aclose()
+    query_cache.save()
+    if answer_cache:
+        answer_cache.close()
+    if query_log:
+        query_log.close()
 
 
 app = FastAPI(lifespan=lifespan)
 
 
+class SearchFilters(BaseModel):
+    """Each field takes one value or a list (any of); fields combine with AND.
+
+    breadcrumb matches a path prefix, e.g. "Tasks/Run Applications".
+    """
+
+    # An unknown field is a 422, not a filter silently left out
+    model_config = ConfigDict(extra="forbid")
+
+    doc_type: str | list[str] | None = None
+    breadcrumb: str | list[str] | None = None
+    source_ref: str | list[str] | None = None
+
+
 class QueryRequest(BaseModel):
     question: str
-    k: int = 5
+    k: int = Field(5, ge=1, le=MAX_K)
+    mode: Literal["dense", "lexical", "hybrid", "auto"] | None = None
+    filters: SearchFilters | None = None
+    # Docs release (source_ref) to answer from, e.g. "release-1.32"
+    version: str | None = None
+    # Give up (503 while queued, 504 after) once this much time has passed
+    deadline_ms: float | None = Field(None, gt=0)
 
 
 class QueryResponse(BaseModel):
     answer: str
     sources: list[dict]
     latency_ms: float
+    cached: bool = False
+    # Answered by an identical request that was already in flight
+    coalesced: bool = False
 
 
-@app.post("/query", response_model=QueryResponse)
-async def query(req: QueryRequest):
-    t0 = time.perf_counter()
+async def _retrieve(req: QueryRequest) -> tuple:
+    """(qvec, cache_scope, cached answer or None, search results)."""
+    try:
+        # First use of a version shard loads it from disk
+        shard = await asyncio.to_thread(retriever.shard, req.version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
 
-    search_results = retriever.search(req.question, k=req.k)
-    context = format_context_from_results(search_results, k=5)
-
-    resp = await llm_client.post(
-        "/chat/completions",
-        json={
-            "model": "Qwen/Qwen2.5-7B-Instruct",
-            "messages": [
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {
-                    "role": "user",
-                    "content": f"Context:\n{context}\n\nQuestion: {req.question}\n\nAnswer:",
-                },
-            ],
-            "max_tokens": 512,
-            "temperature": 0,
-        },
+    try:
+        mode = shard.resolve_mode(req.question, req.mode)
+    except ValueError as e:
+        # lexical / hybrid on an index built without bm25 files
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = req.filters.model_dump(exclude_none=True) if req.filters else None
+    if filters and shard.facets is None:
+        raise HTTPException(
+            status_code=400,
+            detail="This index has no facet files; rebuild it to use filters",
+        )
+    # A cached answer only serves requests retrieving the same way
+    cache_scope = (
+        shard.default_ref,
+        req.k,
+        mode,
+        repr(sorted((filters or {}).items())),
+    )
+    # Lexical retrieval never runs the embedding model
+    qvec = cascade_qvec = None
+    if mode != "lexical" and shard.cascade is not None:
+        # Both encodes ride in the same embed batch
+        qvec, cascade_qvec = await asyncio.gather(
+            embed_batcher.submit((shard.embedder, req.question)),
+            embed_batcher.submit((shard.cascade.embedder, req.question)),
+        )
+    elif mode != "lexical":
+        qvec = await embed_batcher.submit((shard.embedder, req.question))
+
+    if SEMANTIC_CACHE and qvec is not None:
+        hit = semantic_cache.lookup(qvec, retriever.version, cache_scope)
+        if hit is not None:
+            return qvec, cache_scope, hit, None
+
+    k = max(req.k, RERANK_FETCH) if reranker else req.k
+    search_results = await search_batcher.submit(
+        (shard, req.question, k, mode, qvec, cascade_qvec, filters)
+    )
+    if reranker:
+        search_results = await asyncio.to_thread(
+            reranker.rerank,
+            req.question,
+            search_results,
+            top_k=req.k,
+            min_score=RERANK_MIN_SCORE,
+            max_chars=RERANK_MAX_CHARS,
+        )
+    return qvec, cache_scope, None, search_results
+
+
+def _sources(results: list[dict], k: int) -> list[dict]:
+    sources = []
+    for r in results[:k]:
+        if not r.get("heading"):
+            continue
+        source = {"heading": r["heading"], "url": r.get("url", "")}
+        # Chunks collapsed by ingest.dedup also list every page they appear on
+        if len(r.get("urls") or []) > 1:
+            source["urls"] = r["urls"]
+        sources.append(source)
+    return sources
+
+
+async def _acquire(deadline: float | None) -> float | None:
+    """Wait for a vLLM slot; returns when it was granted (None: no limit).
+
+    Without a deadline the wait is only capped by QUEUE_TIMEOUT_S.
+    """
+    if admission is None:
+        return None
+    timeout_s = QUEUE_TIMEOUT_S
+    if deadline is not None:
+        timeout_s = min(timeout_s, deadline - time.perf_counter())
+    await admission.acquire(timeout_s)
+    return time.perf_counter()
+
+
+def _release(granted: float | None):
+    if admission is not None and granted is not None:
+        admission.release(time.perf_counter() - granted)
+
+
+def _shed_response(e: Overloaded) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=f"Overloaded ({e.reason}), retry later",
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after_s)))},
     )
+
+
+def _check_rate(request: Request):
+    if rate_limiter is None:
+        return
+    client = request.client.host if request.client else ""
+    if "*" in TRUSTED_PROXIES or client in TRUSTED_PROXIES:
+        client = request.headers.get("x-client-id") or client
+    wait_s = rate_limiter.check(client)
+    if wait_s:
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(max(1, math.ceil(wait_s)))},
+        )
+
+
+def _deadline(req: QueryRequest, t0: float) -> float:
+    return t0 + (req.deadline_ms / 1000 if req.deadline_ms else REQUEST_TIMEOUT_S)
+
+
+async def _answer(req: QueryRequest, deadline: float | None = None) -> dict:
+    qvec, cache_scope, hit, search_results = await _retrieve(req)
+    if hit is not None:
+        return {"answer": hit["answer"], "sources": hit["sources"], "cached": True}
+
+    messages = await asyncio.to_thread(_build_messages, req.question, search_results)
+
+    granted = await _acquire(deadline)
+    try:
+        resp = await llm_client.post(
+            "/chat/completions",
+            json={
+                "model": LLM_MODEL,
+                "messages": messages,
+                "max_tokens": MAX_TOKENS,
+                "temperature": 0,
+            },
+        )
+    finally:
+        _release(granted)
     resp.raise_for_status()
     data = resp.json()
     answer = data["choices"][0]["message"]["content"]
 
+    sources = _sources(search_results, req.k)
+    if SEMANTIC_CACHE and qvec is not None:
+        semantic_cache.store(qvec, retriever.version, cache_scope, answer, sources)
+    if answer_cache:
+        await asyncio.to_thread(
+            answer_cache.put, _answer_key(req), req.question, answer, sources
+        )
+    return {"answer": answer, "sources": sources, "cached": False}
+
+
+def _flight_key(req: QueryRequest) -> tuple:
+    """Requests with the same key get the same answer: normalized question,
+    k, retrieval options and index version."""
+    return (
+        normalize_query(req.question),
+        req.k,
+        req.mode,
+        req.filters.model_dump_json(exclude_none=True) if req.filters else None,
+        req.version,
+        retriever.version,
+    )
+
+
+def _answer_key(req: QueryRequest) -> str:
+    return answer_key(*_flight_key(req), LLM_MODEL, PROMPT_HASH)
+
+
+def _exact_hit(req: QueryRequest) -> dict | None:
+    """Log the request and look up its cached answer; file and SQLite I/O,
+    so callers run it off the event loop."""
+    if query_log:
+        query_log.append(req.model_dump(exclude_none=True, exclude={"deadline_ms"}))
+    return answer_cache.get(_answer_key(req)) if answer_cache else None
+
+
+async def _warm_answers():
+    """Answer the most frequent logged questions the cache doesn't hold,
+    one at a time so live traffic keeps priority."""
+    global answer_warmup
+    t0 = time.perf_counter()
+    answer_warmup = {"questions": 0, "cached": 0, "answered": 0, "failed": 0}
+    try:
+        # Log lines that don't parse or no longer validate are skipped
+        hot, answer_warmup["skipped"] = await asyncio.to_thread(
+            query_log.most_frequent,
+            ANSWER_CACHE_WARMUP,
+            key=lambda r: _flight_key(QueryRequest(**r)),
+        )
+        answer_warmup["questions"] = len(hot)
+        for r in hot:
+            req = QueryRequest(**r)
+            if await asyncio.to_thread(answer_cache.__contains__, _answer_key(req)):
+                answer_warmup["cached"] += 1
+                continue
+            try:
+                await single_flight.do(_flight_key(req), lambda: _answer(req))
+                answer_warmup["answered"] += 1
+            except Exception:
+                answer_warmup["failed"] += 1
+    except Exception as e:
+        # A background task's exception would otherwise go unseen
+        logger.exception("Answer cache warmup stopped")
+        answer_warmup["error"] = repr(e)
+    answer_warmup["s"] = round(time.perf_counter() - t0, 1)
+
+
+@app.post("/query", response_model=QueryResponse)
+async def query(req: QueryRequest, request: Request):
+    t0 = time.perf_counter()
+    _check_rate(request)
+    hit = await asyncio.to_thread(_exact_hit, req)
+    if hit is not None:
+        latency = (time.perf_counter() - t0) * 1000
+        metrics.record(latency)
+        return QueryResponse(**hit, latency_ms=round(latency, 1), cached=True)
+
+    deadline = _deadline(req, t0)
+    if SINGLE_FLIGHT:
+        # Shared work isn't bound to this caller's deadline: every caller
+        # applies its own below, and the work stops once all have gone
+        work = single_flight.do(_flight_key(req), lambda: _answer(req))
+    else:
+        work = _answer(req, deadline)
+    try:
+        # On timeout the work is cancelled, aborting the vLLM request, unless
+        # coalesced requests are still waiting for it
+        out = await asyncio.wait_for(work, deadline - time.perf_counter())
+    except Overloaded as e:
+        raise _shed_response(e)
+    except asyncio.TimeoutError:
+        if admission is not None:
+            admission.count_shed("timeout")
+        raise HTTPException(status_code=504, detail="Deadline exceeded")
+    out, coalesced = out if SINGLE_FLIGHT else (out, False)
+
     latency = (time.perf_counter() - t0) * 1000
     metrics.record(latency)
+    return QueryResponse(**out, latency_ms=round(latency, 1), coalesced=coalesced)
 
-    sources = [
-        {"heading": r.get("heading", ""), "url": r.get("url", "")}
-        for r in search_results[: req.k]
-        if r.get("heading")
-    ]
 
-    return QueryResponse(
-        answer=answer,
-        sources=sources,
-        latency_ms=round(latency, 1),
+def _event(kind: str, **fields) -> str:
+    return json.dumps({"type": kind, **fields}) + "\n"
+
+
+@app.post("/query/stream")
+async def query_stream(req: QueryRequest, request: Request):
+    """Same answer as /query as NDJSON events: "sources" right after
+    retrieval, a "token" per vLLM delta, then "done" with the timings."""
+    t0 = time.perf_counter()
+    _check_rate(request)
+    hit = await asyncio.to_thread(_exact_hit, req)
+    if hit is None:
+        qvec, cache_scope, hit, search_results = await _retrieve(req)
+
+    if hit is not None:
+
+        async def cached():
+            latency = (time.perf_counter() - t0) * 1000
+            metrics.record(latency)
+            yield _event("sources", sources=hit["sources"])
+            yield _event("token", text=hit["answer"])
+            yield _event("done", latency_ms=round(latency, 1), cached=True)
+
+        return StreamingResponse(cached(), media_type="application/x-ndjson")
+
+    sources = _sources(search_results, req.k)
+    messages = await asyncio.to_thread(_build_messages, req.question, search_results)
+    try:
+        # The slot is held until the last token is relayed
+        granted = await _acquire(_deadline(req, t0))
+    except Overloaded as e:
+        raise _shed_response(e)
+
+    async def events():
+        tokens, gaps = [], []
+        ttft = last = None
+        try:
+            yield _event("sources", sources=sources)
+            async with llm_client.stream(
+                "POST",
+                "/chat/completions",
+                json={
+                    "model": LLM_MODEL,
+                    "messages": messages,
+                    "max_tokens": MAX_TOKENS,
+                    "temperature": 0,
+                    "stream": True,
+                },
+            ) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    # Server-sent events: "data: {chunk}" lines, then "data: [DONE]"
+                    if not line.startswith("data: ") or line == "data: [DONE]":
+                        continue
+                    choices = json.loads(line[len("data: ") :]).get("choices")
+                    text = choices[0]["delta"].get("content") if choices else None
+                    if not text:
+                        continue
+                    now = time.perf_counter()
+                    if last is None:
+                        ttft = (now - t0) * 1000
+                    else:
+                        gaps.append((now - last) * 1000)
+                    last = now
+                    tokens.append(text)
+                    yield _event("token", text=text)
+        except httpx.HTTPError as e:
+            # The 200 and the sources are already sent
+            yield _event("error", detail=repr(e))
+            return
+        finally:
+            # Free the slot before the cache writes; the response releases it
+            # too if the client leaves before this generator runs
+            response.release()
+
+        latency = (time.perf_counter() - t0) * 1000
+        metrics.record(latency)
+        if ttft is not None:
+            metrics.record_stream(ttft, gaps)
+        answer = "".join(tokens)
+        if SEMANTIC_CACHE and qvec is not None:
+            semantic_cache.store(qvec, retriever.version, cache_scope, answer, sources)
+        if answer_cache:
+            await asyncio.to_thread(
+                answer_cache.put, _answer_key(req), req.question, answer, sources
+            )
+        yield _event(
+            "done",
+            latency_ms=round(latency, 1),
+            ttft_ms=round(ttft, 1) if ttft is not None else None,
+            cached=False,
+        )
+
+    response = SlotStreamingResponse(
+        events(), lambda: _release(granted), media_type="application/x-ndjson"
     )
+    return response
 
 
 @app.get("/metrics")
 async def get_metrics():
-    return metrics.summary()
+    summary = {
+        **metrics.summary(),
+        "query_embedding_cache": query_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "prefix_cache": prefix_cache.stats(await _prefix_counters()),
+        "single_flight": single_flight.stats(),
+    }
+    if answer_cache:
+        summary["answer_cache"] = {**answer_cache.stats(), "warmup": answer_warmup}
+    if admission:
+        summary["admission"] = admission.stats()
+    if rate_limiter:
+        summary["rate_limit"] = rate_limiter.stats()
+    summary["batching"] = {
+        "embed": embed_batcher.stats(),
+        "search": search_batcher.stats(),
+    }
+    if isinstance(retriever, ShardedRetriever):
+        summary["shards"] = retriever.stats()
+    return summary
 
 
 @app.post("/metrics/reset")
 async def reset_metrics():
     metrics.reset()
+    prefix_cache.reset(await _prefix_counters())
+    single_flight.reset()
+    if answer_cache:
+        answer_cache.reset()
+    if admission:
+        admission.reset()
+    if rate_limiter:
+        rate_limiter.reset()
+    embed_batcher.reset()
+    search_batcher.reset()
     return {"status": "reset"}
 
 
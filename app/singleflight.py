@@ -0,0 +1,76 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one shared task.
+
+    The first caller for a key starts `fn()` as a task; callers arriving
+    while it runs await the same task instead of starting their own. The
+    key is forgotten as soon as the task finishes, so later calls run
+    fresh. A caller that goes away (client disconnect, deadline) does not
+    cancel the work the others are waiting on, but when the last waiter
+    leaves the work is cancelled, so it stops holding a vLLM slot for an
+    answer nobody will read.
+    """
+
+    def __init__(self):
+        self._inflight: dict = {}
+        self._waiters: dict = {}
+        self.reset()
+
+    def reset(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+        self.abandoned = 0
+
+    async def do(self, key, fn) -> tuple:
+        """(result, shared): shared is True when another call did the work."""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+            self._waiters[key] += 1
+            self.max_waiters = max(self.max_waiters, self._waiters[key])
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._waiters[key] = 1
+            task.add_done_callback(lambda t: self._done(key, t))
+        try:
+            return await asyncio.shield(task), shared
+        finally:
+            self._leave(key, task)
+
+    def _leave(self, key, task: asyncio.Task):
+        if task.done() or self._inflight.get(key) is not task:
+            return
+        self._waiters[key] -= 1
+        if not self._waiters[key]:
+            # Forget it now, so a new call doesn't join the cancelled task
+            self._forget(key, task)
+            self.abandoned += 1
+            task.cancel()
+
+    def _forget(self, key, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            del self._waiters[key]
+
+    def _done(self, key, task: asyncio.Task):
+        self._forget(key, task)
+        # Mark the exception retrieved when every caller has gone away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        total = self.leaders + self.coalesced
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / total, 4) if total else 0.0,
+            "max_waiters": self.max_waiters,
+            "abandoned": self.abandoned,
+            "in_flight": len(self._inflight),
+        }
@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import time
+
+import faiss
+import numpy as np
+
+from rag.bge import BGEEmbedder
+from rag.projection import Projection
+from rag.vector_index import (
+    CALIBRATION,
+    load_manifest,
+    search_params,
+    tuning_param,
+)
+
+OUTPUT_DIR = "data/bench"
+
+SWEEPS = {
+    "nprobe": [1, 2, 4, 8, 16, 32, 64, 128],
+    "ef_search": [16, 32, 64, 128, 256, 512],
+}
+
+
+def recall_at_k(approx_ids: np.ndarray, exact_ids: np.ndarray) -> float:
+    k = exact_ids.shape[1]
+    hits = sum(len(set(a) & set(e)) for a, e in zip(approx_ids, exact_ids))
+    return hits / (len(exact_ids) * k)
+
+
+def timed_search(index, qvecs: np.ndarray, k: int, params=None):
+    """Search one query at a time, as Retriever.search does, and time each call."""
+    ids, lats = [], []
+    for q in qvecs:
+        t0 = time.perf_counter()
+        _, idx = index.search(q.reshape(1, -1), k, params=params)
+        lats.append((time.perf_counter() - t0) * 1000)
+        ids.append(idx[0])
+    return np.array(ids), np.array(lats)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index-dir", default="data/vector_index")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.index_dir)
+    index_type = manifest["index_type"]
+    param = tuning_param(index_type)
+    if param is None:
+        parser.error(f"{args.index_dir} is a {index_type} index; nothing to tune")
+
+    index = faiss.read_index(f"{args.index_dir}/index.faiss")
+    vectors = np.load(f"{args.index_dir}/vectors.npy")
+    flat = faiss.IndexFlatIP(vectors.shape[1])
+    flat.add(vectors)
+
+    queries = [json.loads(line) for line in open("data/eval/queries.jsonl")]
+    embedder = BGEEmbedder()
+    qvecs = embedder.encode_queries([q["query"] for q in queries])
+    if Projection.exists(args.index_dir):
+        qvecs = Projection.load(args.index_dir).apply(qvecs)
+
+    exact_ids, flat_lats = timed_search(flat, qvecs, args.k)
+    print(
+        f"flat: mean {flat_lats.mean():.3f}ms, p99 {np.percentile(flat_lats, 99):.3f}ms"
+    )
+
+    points = []
+    for value in SWEEPS[param]:
+        params = search_params(index_type, **{param: value})
+        ids, lats = timed_search(index, qvecs, args.k, params=params)
+        point = {
+            "value": value,
+            f"recall@{args.k}": round(recall_at_k(ids, exact_ids), 4),
+            "latency_ms": round(float(np.mean(lats)), 4),
+            "p99_ms": round(float(np.percentile(lats, 99)), 4),
+        }
+        points.append(point)
+        print(
+            f"{param}={value:<4} recall@{args.k} {point[f'recall@{args.k}']:.3f}"
+            f"  mean {point['latency_ms']:.3f}ms  p99 {point['p99_ms']:.3f}ms"
+        )
+
+    result = {
+        "index_type": index_type,
+        "params": manifest.get("params", {}),
+        "num_vectors": int(index.ntotal),
+        "num_queries": len(queries),
+        "tuning_param": param,
+        "flat_latency_ms": round(float(np.mean(flat_lats)), 4),
+        "points": points,
+    }
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    out_path = f"{OUTPUT_DIR}/ann_{index_type}.json"
+    json.dump(result, open(out_path, "w"), indent=2)
+
+    # Retriever derives nprobe/efSearch from a latency budget using these points
+    json.dump(
+        {"tuning_param": param, "points": points},
+        open(f"{args.index_dir}/{CALIBRATION}", "w"),
+        indent=2,
+    )
+    print(f"Saved: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
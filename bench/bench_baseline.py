@@ -28,10 +28,10 @@ def main():
     print("Warming up...")
     _ = llm.generate_answer("test")
 
-    for i, q in enumerate(queries):
-        print(f"[{i + 1}/{len(queries)}] {q['query'][:50]}...")
+    contexts = retriever.search_and_format_batch([q["query"] for q in queries], k=5)
 
-        context = retriever.search_and_format(q["query"], k=5)
+    for i, (q, context) in enumerate(zip(queries, contexts)):
+        print(f"[{i + 1}/{len(queries)}] {q['query'][:50]}...")
 
         t0 = time.perf_counter()
         _ = llm.generate_answer(
@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from rag.eval import hit_at_k, mrr
+from rag.retrieve import Retriever
+
+OUTPUT_DIR = "data/bench"
+FETCH_SWEEP = [2, 5, 10, 20]
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, (time.perf_counter() - t0) * 1000
+
+
+def pct(values, q) -> float:
+    return round(float(np.percentile(values, q)), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index-dir", default="data/vector_index")
+    parser.add_argument("--cascade-dir", default="data/vector_index_small")
+    parser.add_argument("--fetch", type=int, nargs="+", default=FETCH_SWEEP)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    # No query cache: every call runs its encoder
+    retriever = Retriever(args.index_dir, cascade_dir=args.cascade_dir)
+    small = retriever.cascade
+    queries = [json.loads(line) for line in open("data/eval/queries.jsonl")]
+    texts = [q["query"] for q in queries]
+
+    print("Warming up...")
+    retriever.embedder.encode_queries(texts[:8])
+    small.embedder.encode_queries(texts[:8])
+
+    # One query per call, the way /query encodes and searches
+    large_ms, small_ms = [], []
+    large_qvecs, small_qvecs = [], []
+    for q in texts:
+        v, ms = timed(retriever.embedder.encode_query, q)
+        large_qvecs.append(v)
+        large_ms.append(ms)
+        v, ms = timed(small.embedder.encode_query, q)
+        small_qvecs.append(v)
+        small_ms.append(ms)
+
+    # Reference ranking: exhaustive search of the large-model index
+    full_ids, full_ms = [], []
+    for v in large_qvecs:
+        (_, ids), ms = timed(retriever._dense_search, v, args.k)
+        full_ids.append(ids[0])
+        full_ms.append(ms)
+
+    def score(ids_per_query) -> dict:
+        hits, mrrs, overlap = [], [], []
+        for ids, ref, q in zip(ids_per_query, full_ids, queries):
+            results = retriever._rows(np.zeros(len(ids)), ids)
+            hits.append(hit_at_k(results, q["answer_refs"], k=5))
+            mrrs.append(mrr(results, q["answer_refs"], k=5))
+            overlap.append(len(set(ids[ids >= 0]) & set(ref[ref >= 0])) / args.k)
+        return {
+            "hit@5": round(float(np.mean(hits)), 3),
+            "mrr@5": round(float(np.mean(mrrs)), 3),
+            f"top{args.k}_overlap": round(float(np.mean(overlap)), 3),
+        }
+
+    full_total = np.array(large_ms) + np.array(full_ms)
+    rows = [
+        {
+            "setup": "large",
+            **score(full_ids),
+            "encode_p50_ms": pct(large_ms, 50),
+            "search_p50_ms": pct(full_ms, 50),
+            "search_p99_ms": pct(full_ms, 99),
+            "total_p50_ms": pct(full_total, 50),
+            "total_p99_ms": pct(full_total, 99),
+        }
+    ]
+
+    for fetch in args.fetch:
+        retriever.cascade_fetch = fetch
+        ids_per_query, search_ms = [], []
+        for sv, lv in zip(small_qvecs, large_qvecs):
+            (_, ids), ms = timed(
+                retriever._cascade_search, sv.reshape(1, -1), lv.reshape(1, -1), args.k
+            )
+            ids_per_query.append(ids[0])
+            search_ms.append(ms)
+        encode_ms = np.array(small_ms) + np.array(large_ms)
+        total = encode_ms + np.array(search_ms)
+        rows.append(
+            {
+                "setup": f"cascade x{fetch}",
+                "fetch": fetch,
+                **score(ids_per_query),
+                "encode_p50_ms": pct(encode_ms, 50),
+                "search_p50_ms": pct(search_ms, 50),
+                "search_p99_ms": pct(search_ms, 99),
+                "total_p50_ms": pct(total, 50),
+                "total_p99_ms": pct(total, 99),
+            }
+        )
+
+    for row in rows:
+        print(
+            f"{row['setup']:<12} hit@5 {row['hit@5']:.3f}  mrr@5 {row['mrr@5']:.3f}"
+            f"  top{args.k} overlap {row[f'top{args.k}_overlap']:.3f}"
+            f"  search p50 {row['search_p50_ms']:.2f}ms"
+            f"  total p50 {row['total_p50_ms']:.1f}ms"
+        )
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    out_path = f"{OUTPUT_DIR}/cascade.json"
+    json.dump(
+        {
+            "model": retriever.embedder.model_name,
+            "cascade_model": small.embedder.model_name,
+            "index_type": retriever.index_type,
+            "cascade_index_type": small.index_type,
+            "num_vectors": int(retriever.index.ntotal),
+            "num_queries": len(queries),
+            "large_encode_p50_ms": pct(large_ms, 50),
+            "small_encode_p50_ms": pct(small_ms, 50),
+            "rows": rows,
+        },
+        open(out_path, "w"),
+        indent=2,
+    )
+    print(f"Saved: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import time
+
+from rag.bge import BGEEmbedder
+from rag.embed_pool import default_threads, encode_parallel
+
+OUTPUT_DIR = "data/bench"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", default="data/processed/chunks_html.jsonl")
+    parser.add_argument("--num-chunks", type=int, default=4000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Worker counts to try (default 1, 2, 4, ... up to the core count)",
+    )
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    texts = []
+    with open(args.chunks, encoding="utf-8") as f:
+        for line in f:
+            texts.append(json.loads(line)["text"])
+            if len(texts) == args.num_chunks:
+                break
+
+    cores = os.cpu_count() or 1
+    worker_counts = args.workers
+    if worker_counts is None:
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= cores:
+            worker_counts.append(worker_counts[-1] * 2)
+
+    embedder = BGEEmbedder()
+    print("Warming up...")
+    embedder.encode(texts[:32], show_progress_bar=False)
+
+    # Reference: today's single-process encode using every core
+    t0 = time.perf_counter()
+    embedder.encode(texts, batch_size=args.batch_size, show_progress_bar=False)
+    inprocess_s = time.perf_counter() - t0
+    rows = [
+        {
+            "workers": 0,
+            "threads_per_worker": cores,
+            "wall_s": round(inprocess_s, 2),
+            "chunks_per_s": round(len(texts) / inprocess_s, 1),
+            "speedup": 1.0,
+        }
+    ]
+    print(f"in-process      {rows[0]['chunks_per_s']:>8.1f} chunks/s")
+
+    for workers in worker_counts:
+        threads = default_threads(workers)
+        # Wall time includes each worker loading the model, as in a real build
+        t0 = time.perf_counter()
+        encode_parallel(
+            texts,
+            embedder.model_name,
+            workers,
+            threads=threads,
+            batch_size=args.batch_size,
+        )
+        wall_s = time.perf_counter() - t0
+        row = {
+            "workers": workers,
+            "threads_per_worker": threads,
+            "wall_s": round(wall_s, 2),
+            "chunks_per_s": round(len(texts) / wall_s, 1),
+            "speedup": round(inprocess_s / wall_s, 2),
+        }
+        rows.append(row)
+        print(
+            f"workers={workers:<3} x{threads:<3} {row['chunks_per_s']:>8.1f} chunks/s"
+            f"  ({row['speedup']:.2f}x)"
+        )
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    out_path = f"{OUTPUT_DIR}/embed_workers.json"
+    json.dump(
+        {
+            "model": embedder.model_name,
+            "num_chunks": len(texts),
+            "cpu_count": cores,
+            "batch_size": args.batch_size,
+            "rows": rows,
+        },
+        open(out_path, "w"),
+        indent=2,
+    )
+    print(f"Saved: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from rag.bge import BACKENDS, DEFAULT_QUANTIZATION, BGEEmbedder
+from rag.retrieve import Retriever
+
+OUTPUT_DIR = "data/bench"
+BATCH_SIZES = [8, 32, 128]
+
+
+def latency(embedder: BGEEmbedder, queries: list[str], repeats: int) -> dict:
+    embedder.encode_queries(queries[:8])  # warm-up
+
+    single = []
+    for _ in range(repeats):
+        for q in queries:
+            t0 = time.perf_counter()
+            embedder.encode_query(q)
+            single.append((time.perf_counter() - t0) * 1000)
+
+    single = np.array(single)
+    row = {
+        "single_p50_ms": round(float(np.percentile(single, 50)), 2),
+        "single_p99_ms": round(float(np.percentile(single, 99)), 2),
+    }
+    pool = [queries[i % len(queries)] for i in range(max(BATCH_SIZES))]
+    for bs in BATCH_SIZES:
+        per_query = []
+        for _ in range(repeats):
+            for start in range(0, len(pool), bs):
+                batch = pool[start : start + bs]
+                t0 = time.perf_counter()
+                embedder.encode_queries(batch)
+                per_query.append((time.perf_counter() - t0) * 1000 / len(batch))
+        row[f"batch{bs}_per_query_ms"] = round(float(np.mean(per_query)), 3)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index-dir", default="data/vector_index")
+    parser.add_argument(
+        "--backends", nargs="+", choices=BACKENDS, default=["torch", "onnx-int8"]
+    )
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--quantization", default=DEFAULT_QUANTIZATION)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    queries = [json.loads(line)["query"] for line in open("data/eval/queries.jsonl")]
+    retriever = Retriever(args.index_dir)
+    model_name = retriever.embedder.model_name
+
+    # PyTorch vectors are the reference: the index was built with them
+    reference = retriever.embedder.encode_queries(queries)
+    _, ref_ids = retriever._dense_search(reference, args.k)
+
+    rows = []
+    for backend in args.backends:
+        # No query cache, so every call runs the encoder
+        embedder = BGEEmbedder(
+            model_name,
+            backend=backend,
+            threads=args.threads,
+            quantization=args.quantization,
+        )
+        vecs = embedder.encode_queries(queries)
+        cosine = np.sum(vecs * reference, axis=1)
+        _, ids = retriever._dense_search(vecs, args.k)
+        overlap = [
+            len(set(a) & set(b)) / args.k
+            for a, b in zip(ids.tolist(), ref_ids.tolist())
+        ]
+
+        row = {
+            "backend": backend,
+            "cosine_mean": round(float(np.mean(cosine)), 5),
+            "cosine_min": round(float(np.min(cosine)), 5),
+            f"top{args.k}_overlap": round(float(np.mean(overlap)), 3),
+            **latency(embedder, queries, args.repeats),
+        }
+        rows.append(row)
+        print(
+            f"{backend:<10} cos mean {row['cosine_mean']:.4f} min {row['cosine_min']:.4f}"
+            f"  top{args.k} overlap {row[f'top{args.k}_overlap']:.3f}"
+            f"  single p50 {row['single_p50_ms']:.1f}ms"
+            f"  batch{BATCH_SIZES[-1]} {row[f'batch{BATCH_SIZES[-1]}_per_query_ms']:.2f}ms/q"
+        )
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    out_path = f"{OUTPUT_DIR}/embedder_backends.json"
+    json.dump(
+        {
+            "model": model_name,
+            "threads": args.threads,
+            "quantization": args.quantization,
+            "num_queries": len(queries),
+            "rows": rows,
+        },
+        open(out_path, "w"),
+        indent=2,
+    )
+    print(f"Saved: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from rag.eval import hit_at_k, mrr
+from rag.retrieve import MODES, Retriever
+
+OUTPUT_DIR = "data/bench"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index-dir", default="data/vector_index")
+    args = parser.parse_args()
+
+    retriever = Retriever(args.index_dir)
+    queries = [json.loads(line) for line in open("data/eval/queries.jsonl")]
+
+    print("Warming up...")
+    retriever.search("test", k=5)
+
+    rows = []
+    for mode in MODES:
+        latencies, hits, mrrs = [], [], []
+        routed_lexical = 0
+        # One query per call, the way /query retrieves
+        for q in queries:
+            t0 = time.perf_counter()
+            results = retriever.search(q["query"], k=5, mode=mode)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            hits.append(hit_at_k(results, q["answer_refs"], k=5))
+            mrrs.append(mrr(results, q["answer_refs"], k=5))
+            routed_lexical += retriever.resolve_mode(q["query"], mode) == "lexical"
+
+        lats = np.array(latencies)
+        row = {
+            "mode": mode,
+            "hit@5": round(float(np.mean(hits)), 3),
+            "mrr@5": round(float(np.mean(mrrs)), 3),
+            "p50_ms": round(float(np.percentile(lats, 50)), 2),
+            "p99_ms": round(float(np.percentile(lats, 99)), 2),
+            "mean_ms": round(float(np.mean(lats)), 2),
+            "lexical_queries": int(routed_lexical),
+        }
+        rows.append(row)
+        print(
+            f"{mode:<8} hit@5 {row['hit@5']:.3f}  mrr@5 {row['mrr@5']:.3f}"
+            f"  p50 {row['p50_ms']:.2f}ms  p99 {row['p99_ms']:.2f}ms"
+        )
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    out_path = f"{OUTPUT_DIR}/retrieval_modes.json"
+    json.dump(
+        {"num_queries": len(queries), "rows": rows}, open(out_path, "w"), indent=2
+    )
+    print(f"Saved: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
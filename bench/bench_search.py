@@ -0,0 +1,63 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from rag.retrieve import Retriever
+
+OUTPUT_DIR = "data/bench"
+BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index-dir", default="data/vector_index")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    retriever = Retriever(args.index_dir)
+    queries = [json.loads(line)["query"] for line in open("data/eval/queries.jsonl")]
+    # Cycle the eval set so the largest batch is full
+    pool = [queries[i % len(queries)] for i in range(max(BATCH_SIZES))]
+
+    print("Warming up...")
+    retriever.search_batch(pool[:8], k=args.k)
+
+    rows = []
+    for bs in BATCH_SIZES:
+        per_query = []
+        for _ in range(args.repeats):
+            for start in range(0, len(pool), bs):
+                batch = pool[start : start + bs]
+                t0 = time.perf_counter()
+                retriever.search_batch(batch, k=args.k)
+                per_query.append((time.perf_counter() - t0) * 1000 / len(batch))
+
+        lats = np.array(per_query)
+        row = {
+            "batch_size": bs,
+            "per_query_ms": round(float(np.mean(lats)), 3),
+            "p99_per_query_ms": round(float(np.percentile(lats, 99)), 3),
+            "queries_per_s": round(1000 / float(np.mean(lats)), 1),
+        }
+        rows.append(row)
+        print(
+            f"batch={bs:<4} {row['per_query_ms']:>8.3f} ms/query"
+            f"  {row['queries_per_s']:>8.1f} q/s"
+        )
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    out_path = f"{OUTPUT_DIR}/search_batch.json"
+    json.dump(
+        {"index_type": retriever.index_type, "k": args.k, "rows": rows},
+        open(out_path, "w"),
+        indent=2,
+    )
+    print(f"Saved: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
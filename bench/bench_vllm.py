@@ -13,6 +13,7 @@ from rag.retrieve import Retriever
 
 VLLM_URL = "http://localhost:8100/v1/chat/completions"
 RAG_URL = "http://localhost:8000/query"
+RAG_METRICS_URL = "http://localhost:8000/metrics"
 OUTPUT_DIR = "data/bench"
 
 queries = [json.loads(line) for line in open("data/eval/queries.jsonl")]
@@ -42,6 +43,9 @@ def get_used_gpu_mem():
 
 async def bench_direct(queries_list):
     retriever = Retriever("data/vector_index")
+    contexts = retriever.search_and_format_batch(
+        [q["query"] for q in queries_list], k=5
+    )
 
     async with httpx.AsyncClient(timeout=120.0) as client:
         print("Warming up...")
@@ -55,11 +59,9 @@ async def bench_direct(queries_list):
         )
 
         latencies = []
-        for i, q in enumerate(queries_list):
+        for i, (q, context) in enumerate(zip(queries_list, contexts)):
             print(f"[{i + 1}/{len(queries_list)}] {q['query'][:50]}...")
 
-            context = retriever.search_and_format(q["query"], k=5)
-
             t0 = time.perf_counter()
             resp = await client.post(
                 VLLM_URL,
@@ -93,10 +95,30 @@ async def send_rag_query(client: httpx.AsyncClient, question: str) -> float:
     return (time.perf_counter() - t0) * 1000
 
 
-async def bench_concurrent(queries_list, n: int):
+async def send_rag_stream(
+    client: httpx.AsyncClient, question: str
+) -> tuple[float, float]:
+    """(total ms, ms to the first answer token) for one /query/stream call."""
+    t0 = time.perf_counter()
+    ttft = None
+    async with client.stream(
+        "POST", f"{RAG_URL}/stream", json={"question": question}
+    ) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if ttft is None and json.loads(line)["type"] == "token":
+                ttft = (time.perf_counter() - t0) * 1000
+    total = (time.perf_counter() - t0) * 1000
+    return total, total if ttft is None else ttft
+
+
+async def bench_concurrent(queries_list, n: int, stream: bool = False):
+    send = send_rag_stream if stream else send_rag_query
     async with httpx.AsyncClient(timeout=120.0) as client:
         print("Warming up...")
-        await send_rag_query(client, "test")
+        await send(client, "test")
+        # Prefix-cache hit rate over the measured queries only
+        await client.post(f"{RAG_METRICS_URL}/reset")
 
         latencies = []
         for batch_start in range(0, len(queries_list), n):
@@ -105,11 +127,13 @@ async def bench_concurrent(queries_list, n: int):
             total_batches = (len(queries_list) + n - 1) // n
             print(f"  Batch {batch_num}/{total_batches} ({len(batch)} queries)...")
 
-            tasks = [send_rag_query(client, q["query"]) for q in batch]
+            tasks = [send(client, q["query"]) for q in batch]
             batch_latencies = await asyncio.gather(*tasks)
             latencies.extend(batch_latencies)
 
-    return latencies
+        server_metrics = (await client.get(RAG_METRICS_URL)).json()
+
+    return latencies, server_metrics
 
 
 # ==================== Main ====================
@@ -125,12 +149,19 @@ async def main():
     parser.add_argument(
         "-n", type=int, default=None, help="Concurrency level via RAG endpoint"
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Use /query/stream and also record time to first token",
+    )
     args = parser.parse_args()
 
     if not args.direct and args.n is None:
         parser.error("Specify --direct or -n <concurrency>")
     if args.direct and args.n is not None:
         parser.error("Use --direct or -n, not both")
+    if args.direct and args.stream:
+        parser.error("--stream goes through the RAG endpoint (-n)")
 
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -138,16 +169,20 @@ async def main():
         print(f"Benchmarking: direct sequential, {len(queries)} queries")
         t0 = time.time()
         latencies = await bench_direct(queries)
+        server_metrics = {}
         wall_time = time.time() - t0
         out_name = "vllm_direct"
     else:
         n = args.n
         print(f"Benchmarking: concurrent={n}, {len(queries)} queries")
         t0 = time.time()
-        latencies = await bench_concurrent(queries, n)
+        latencies, server_metrics = await bench_concurrent(queries, n, args.stream)
         wall_time = time.time() - t0
-        out_name = f"vllm_n{n}"
+        out_name = f"vllm_n{n}_stream" if args.stream else f"vllm_n{n}"
 
+    ttfts = None
+    if args.stream:
+        latencies, ttfts = zip(*latencies)
     lats = np.array(latencies)
 
     result = {
@@ -161,6 +196,19 @@ async def main():
         "wall_time_s": round(wall_time, 2),
         "gpu_mem_mb": get_used_gpu_mem(),
     }
+    prefix_cache = server_metrics.get("prefix_cache")
+    if prefix_cache and prefix_cache.get("available"):
+        result["prefix_cache_hit_rate"] = prefix_cache["hit_rate"]
+    if ttfts:
+        # Client-side time to first token; inter-token gaps as the server saw them
+        result.update(
+            {
+                "ttft_p50_ms": round(float(np.percentile(ttfts, 50)), 1),
+                "ttft_p99_ms": round(float(np.percentile(ttfts, 99)), 1),
+                "itl_p50_ms": server_metrics["itl_p50_ms"],
+                "itl_p99_ms": server_metrics["itl_p99_ms"],
+            }
+        )
 
     out_path = f"{OUTPUT_DIR}/{out_name}.json"
     json.dump(result, open(out_path, "w"), indent=2)
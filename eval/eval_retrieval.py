@@ -1,19 +1,96 @@
+import argparse
 import json
-from rag.retrieve import Retriever
-from rag.eval import hit_at_k, mrr
+import time
+from pathlib import Path
+
+import numpy as np
+
+from rag.context import DEFAULT_CONTEXT_TOKENS, ContextPacker
+from rag.embed_cache import text_hash
+from rag.local_llm import SYSTEM_PROMPT
+from rag.query_cache import QueryEmbeddingCache
+from rag.rerank import DEFAULT_MIN_SCORE, DEFAULT_RERANK_FETCH, CrossEncoderReranker
+from rag.retrieve import MODES, Retriever, format_context_from_results
+from rag.eval import hit_at_k, is_relevant, mrr
+
+LLM_MODEL = "Qwen/Qwen2.5-7B-Instruct"
+
+
+def prompt_tokens(packer: ContextPacker, question: str, context: str) -> int:
+    """Prefill tokens of the /query chat prompt around `context`."""
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": f"Context:\n{context}\n\nQuestion: {question}\n\nAnswer:",
+        },
+    ]
+    return packer.chat_tokens(messages)
 
 
 def main():
-    retriever = Retriever("data/vector_index")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index-dir", default="data/vector_index")
+    parser.add_argument(
+        "--tag", default=None, help="Suffix for output files, e.g. an index mode"
+    )
+    parser.add_argument("--mode", default="dense", choices=MODES)
+    parser.add_argument(
+        "--query-cache",
+        default="data/cache/query_embeddings.npz",
+        help="Persisted query embeddings, so reruns skip the encoder",
+    )
+    parser.add_argument(
+        "--rerank",
+        action="store_true",
+        help="Cross-encoder rerank of over-fetched candidates (tag defaults to rerank)",
+    )
+    parser.add_argument("--rerank-fetch", type=int, default=DEFAULT_RERANK_FETCH)
+    parser.add_argument("--rerank-min-score", type=float, default=DEFAULT_MIN_SCORE)
+    parser.add_argument(
+        "--context-tokens",
+        type=int,
+        default=DEFAULT_CONTEXT_TOKENS,
+        help="Token budget of the packed context (RAG_CONTEXT_TOKENS)",
+    )
+    args = parser.parse_args()
+    if args.rerank and args.tag is None:
+        args.tag = "rerank"
+
+    query_cache = QueryEmbeddingCache(path=args.query_cache)
+    retriever = Retriever(args.index_dir, query_cache=query_cache)
     queries = [json.loads(line) for line in open("data/eval/queries.jsonl")]
 
+    packer = ContextPacker(LLM_MODEL, budget=args.context_tokens)
+
     hit_total, mrr_total = 0, 0.0
     details = []
 
-    for i, q in enumerate(queries):
-        print(f"[{i + 1}/{len(queries)}] {q['query'][:50]}...")
+    all_results = retriever.search_batch(
+        [q["query"] for q in queries],
+        k=args.rerank_fetch if args.rerank else 5,
+        mode=args.mode,
+    )
+    query_cache.save()
+
+    # Dense search alone, one query at a time, on the now-cached embeddings
+    search_ms = []
+    for qvec in retriever.embedder.encode_queries([q["query"] for q in queries]):
+        t0 = time.perf_counter()
+        retriever._dense_search(qvec, 5)
+        search_ms.append((time.perf_counter() - t0) * 1000)
 
-        results = retriever.search(q["query"], k=5)
+    reranker = CrossEncoderReranker() if args.rerank else None
+    rerank_ms = []
+    for q, candidates in zip(queries, all_results):
+        results = candidates[:5]
+        if reranker:
+            # One question per call, the way /query reranks
+            t0 = time.perf_counter()
+            results = reranker.rerank(
+                q["query"], candidates, top_k=5, min_score=args.rerank_min_score
+            )
+            rerank_ms.append((time.perf_counter() - t0) * 1000)
 
         hit_score = hit_at_k(results, q["answer_refs"], k=5)
         mrr_score = mrr(results, q["answer_refs"], k=5)
@@ -21,25 +98,95 @@ def main():
         hit_total += hit_score
         mrr_total += mrr_score
 
-        details.append(
+        row = {
+            "query": q["query"],
+            "hit@5": hit_score,
+            "mrr@5": mrr_score,
+            "chunks": len(results),
+            # Results repeating an earlier result's text spend context for nothing
+            "duplicate_chunks": len(results)
+            - len({text_hash(r.get("text") or "") for r in results}),
+        }
+        # /query sends the packed context; the char-cut one is the old prompt
+        packed = packer.pack(results)
+        chars = format_context_from_results(results, k=5)
+        row.update(
             {
-                "query": q["query"],
-                "hit@5": hit_score,
-                "mrr@5": mrr_score,
+                "prompt_tokens": prompt_tokens(packer, q["query"], packed),
+                "prompt_tokens_chars": prompt_tokens(packer, q["query"], chars),
+                "answer_in_context": is_relevant({"text": packed}, q["answer_refs"]),
+                "answer_in_context_chars": is_relevant(
+                    {"text": chars}, q["answer_refs"]
+                ),
             }
         )
+        if reranker:
+            row["prompt_tokens_top5"] = prompt_tokens(
+                packer, q["query"], packer.pack(candidates[:5])
+            )
+        details.append(row)
 
     total = len(queries)
     results = {
         "total_queries": total,
         "hit@5": round(hit_total / total, 3),
         "mrr@5": round(mrr_total / total, 3),
-        "details": details,
+        "index_type": retriever.index_type,
+        "mode": args.mode,
+        "index_bytes_per_chunk": retriever.manifest.get("index_bytes_per_chunk"),
+        "index_bytes": (Path(args.index_dir) / "index.faiss").stat().st_size,
+        "dim": retriever.manifest.get("dim"),
+        "projection": retriever.manifest.get("projection"),
+        "search_p50_ms": round(float(np.percentile(search_ms, 50)), 3),
+        "search_p99_ms": round(float(np.percentile(search_ms, 99)), 3),
+        "mean_chunks": round(float(np.mean([d["chunks"] for d in details])), 2),
+        "mean_prompt_tokens": round(
+            float(np.mean([d["prompt_tokens"] for d in details])), 1
+        ),
+        "mean_duplicate_chunks": round(
+            float(np.mean([d["duplicate_chunks"] for d in details])), 2
+        ),
+        "context_tokens": args.context_tokens,
+        "mean_prompt_tokens_chars": round(
+            float(np.mean([d["prompt_tokens_chars"] for d in details])), 1
+        ),
+        "answer_in_context": round(
+            float(np.mean([d["answer_in_context"] for d in details])), 3
+        ),
+        "answer_in_context_chars": round(
+            float(np.mean([d["answer_in_context_chars"] for d in details])), 3
+        ),
     }
+    results["packing_token_reduction"] = round(
+        1 - results["mean_prompt_tokens"] / results["mean_prompt_tokens_chars"], 3
+    )
+    if reranker:
+        before = float(np.mean([d["prompt_tokens_top5"] for d in details]))
+        results.update(
+            {
+                "rerank_model": reranker.model_name,
+                "rerank_fetch": args.rerank_fetch,
+                "rerank_min_score": args.rerank_min_score,
+                "mean_prompt_tokens_top5": round(before, 1),
+                "prompt_token_reduction": round(
+                    1 - results["mean_prompt_tokens"] / before, 3
+                ),
+                "rerank_p50_ms": round(float(np.percentile(rerank_ms, 50)), 1),
+                "rerank_p99_ms": round(float(np.percentile(rerank_ms, 99)), 1),
+            }
+        )
+    results["details"] = details
+
+    name = f"retrieval_{args.tag}" if args.tag else "retrieval"
+    if args.tag:
+        # Compare against the untagged (default index) run
+        baseline = json.load(open("data/eval/retrieval_summary.json"))
+        results["hit@5_delta"] = round(results["hit@5"] - baseline["hit@5"], 3)
+        results["mrr@5_delta"] = round(results["mrr@5"] - baseline["mrr@5"], 3)
 
-    json.dump(results, open("data/eval/retrieval.json", "w"), indent=2)
+    json.dump(results, open(f"data/eval/{name}.json", "w"), indent=2)
     summary = {k: v for k, v in results.items() if k != "details"}
-    json.dump(summary, open("data/eval/retrieval_summary.json", "w"), indent=2)
+    json.dump(summary, open(f"data/eval/{name}_summary.json", "w"), indent=2)
     print(summary)
 
 
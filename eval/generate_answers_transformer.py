@@ -9,12 +9,12 @@ def generate_all():
 
     llm = LocalLLM(model_name="Qwen/Qwen2.5-7B-Instruct")
 
+    contexts = retriever.search_and_format_batch([q["query"] for q in queries], k=5)
+
     results = []
-    for i, q in enumerate(queries):
+    for i, (q, context) in enumerate(zip(queries, contexts)):
         print(f"[{i + 1}/{len(queries)}] {q['query'][:50]}...")
 
-        context = retriever.search_and_format(q["query"], k=5)
-
         answer = llm.generate_answer(
             f"Context:\n{context}\n\nQuestion: {q['query']}\n\nAnswer:"
         )
@@ -1,25 +1,43 @@
+import argparse
 import asyncio
 import json
 
 import httpx
 
+from rag.context import ContextPacker
 from rag.local_llm import SYSTEM_PROMPT
-from rag.retrieve import Retriever
+from rag.rerank import DEFAULT_MIN_SCORE, DEFAULT_RERANK_FETCH, CrossEncoderReranker
+from rag.retrieve import Retriever, format_context_from_results
 
 VLLM_URL = "http://localhost:8100/v1/chat/completions"
 
 
-async def main():
+async def main(rerank: bool = False, pack: bool = False):
     retriever = Retriever("data/vector_index")
     queries = [json.loads(line) for line in open("data/eval/queries.jsonl")]
 
+    questions = [q["query"] for q in queries]
+    if rerank:
+        candidates = retriever.search_batch(questions, k=DEFAULT_RERANK_FETCH)
+        reranked = CrossEncoderReranker().rerank_batch(
+            questions, candidates, top_k=5, min_score=DEFAULT_MIN_SCORE
+        )
+        contexts = [format_context_from_results(r, k=5) for r in reranked]
+    elif pack:
+        # The token-budgeted context /query sends
+        packer = ContextPacker()
+        contexts = [
+            packer.pack(r, canonical=True)
+            for r in retriever.search_batch(questions, k=5)
+        ]
+    else:
+        contexts = retriever.search_and_format_batch([q["query"] for q in queries], k=5)
+
     results = []
     async with httpx.AsyncClient(timeout=120.0) as client:
-        for i, q in enumerate(queries):
+        for i, (q, context) in enumerate(zip(queries, contexts)):
             print(f"[{i + 1}/{len(queries)}] {q['query'][:50]}...")
 
-            context = retriever.search_and_format(q["query"], k=5)
-
             resp = await client.post(
                 VLLM_URL,
                 json={
@@ -47,9 +65,18 @@ async def main():
                 }
             )
 
-    path = "data/eval/answers_vllm.json"
+    suffix = "_rerank" if rerank else "_packed" if pack else ""
+    path = f"data/eval/answers_vllm{suffix}.json"
     json.dump(results, open(path, "w"), indent=2)
     print(f"Saved: {path}")
 
 
-asyncio.run(main())
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--rerank", action="store_true", help="Cross-encoder reranked, trimmed contexts"
+)
+parser.add_argument(
+    "--pack", action="store_true", help="Token-budgeted contexts (rag.context)"
+)
+args = parser.parse_args()
+asyncio.run(main(rerank=args.rerank, pack=args.pack))
@@ -68,4 +68,11 @@ def compare():
 
 
 if __name__ == "__main__":
-    compare()
+    import sys
+
+    if len(sys.argv) > 1:
+        # Judge specific answer files, e.g. data/eval/answers_vllm_rerank.json
+        for path in sys.argv[1:]:
+            judge(path)
+    else:
+        compare()
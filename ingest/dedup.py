@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import re
+import zlib
+from collections import Counter, defaultdict
+
+import numpy as np
+
+# MinHash signature length, split into BANDS bands of NUM_PERM // BANDS rows
+# for LSH. With 16 x 8, a pair at Jaccard 0.85 shares a bucket with
+# probability 0.99; at 0.5 it is under 0.07
+NUM_PERM = 128
+BANDS = 16
+SHINGLE_WORDS = 5
+DEFAULT_THRESHOLD = 0.85
+# Largest 32-bit prime; with 32-bit shingle hashes (a*h + b) % P fits uint64
+_PRIME = np.uint64((1 << 32) - 5)
+
+_WORD = re.compile(r"\S+")
+
+
+def shingles(text: str) -> set[str]:
+    """Overlapping word 5-grams of the lower-cased text."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)}
+    return {
+        " ".join(words[i : i + SHINGLE_WORDS])
+        for i in range(len(words) - SHINGLE_WORDS + 1)
+    }
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, int(_PRIME), size=(num_perm, 1), dtype="uint64")
+        self.b = rng.integers(0, int(_PRIME), size=(num_perm, 1), dtype="uint64")
+
+    def signature(self, text: str) -> np.ndarray:
+        h = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles(text)), dtype="uint64"
+        )
+        return ((self.a * h + self.b) % _PRIME).min(axis=1).astype("uint32")
+
+
+class UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int):
+        ri, rj = self.find(i), self.find(j)
+        # The earliest chunk stays the root, and so the canonical copy
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+
+def iter_chunks(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def find_clusters(path: str, threshold: float, bands: int = BANDS) -> UnionFind:
+    """Near-duplicate clusters by MinHash LSH, never across source_refs."""
+    hasher = MinHasher()
+    rows = NUM_PERM // bands
+    signatures = []
+    buckets: dict[tuple, list[int]] = defaultdict(list)
+    for i, c in enumerate(iter_chunks(path)):
+        sig = hasher.signature(c["text"])
+        signatures.append(sig)
+        for band in range(bands):
+            key = (
+                c.get("source_ref"),
+                band,
+                sig[band * rows : (band + 1) * rows].tobytes(),
+            )
+            buckets[key].append(i)
+
+    clusters = UnionFind(len(signatures))
+    for members in buckets.values():
+        first = signatures[members[0]]
+        for j in members[1:]:
+            # Fraction of agreeing MinHash slots estimates Jaccard similarity
+            if np.mean(signatures[j] == first) >= threshold:
+                clusters.union(members[0], j)
+    return clusters
+
+
+def member_facets(chunk: dict) -> dict:
+    """Facet values a collapsed chunk passes on to its canonical copy;
+    source_ref is left out, since clusters never span releases."""
+    return {f: chunk[f] for f in ("doc_type", "breadcrumb") if chunk.get(f)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", required=True)
+    parser.add_argument("--out", required=True)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Estimated Jaccard similarity of word 5-grams to collapse at",
+    )
+    parser.add_argument("--report", default="data/eval/dedup_summary.json")
+    args = parser.parse_args()
+
+    clusters = find_clusters(args.chunks, args.threshold)
+
+    # Every URL a cluster was found under is kept on its canonical chunk, and
+    # so are the facet values of its members, so filters still find them
+    urls: dict[int, list[str]] = defaultdict(list)
+    facets: dict[int, list[dict]] = defaultdict(list)
+    members: dict[int, list[int]] = defaultdict(list)
+    for i, c in enumerate(iter_chunks(args.chunks)):
+        root = clusters.find(i)
+        members[root].append(i)
+        if c.get("url") and c["url"] not in urls[root]:
+            urls[root].append(c["url"])
+        f = member_facets(c)
+        if f not in facets[root]:
+            facets[root].append(f)
+
+    kept = Counter()
+    largest = sorted(members.items(), key=lambda kv: -len(kv[1]))[:10]
+    examples = {root: None for root, _ in largest}
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as w:
+        for i, c in enumerate(iter_chunks(args.chunks)):
+            if clusters.find(i) != i:
+                continue
+            c["urls"] = urls[i]
+            # The canonical chunk's own values come first
+            if len(facets[i]) > 1:
+                c["member_facets"] = facets[i][1:]
+            w.write(json.dumps(c, ensure_ascii=False) + "\n")
+            kept[c.get("source_ref")] += 1
+            if i in examples:
+                examples[i] = c
+
+    num_in = len(clusters.parent)
+    num_out = sum(kept.values())
+    report = {
+        "chunks_in": num_in,
+        "chunks_out": num_out,
+        "shrink_ratio": round(1 - num_out / max(num_in, 1), 4),
+        "collapsed_clusters": sum(1 for m in members.values() if len(m) > 1),
+        "threshold": args.threshold,
+        "num_perm": NUM_PERM,
+        "bands": BANDS,
+        "chunks_out_by_ref": dict(kept),
+        "largest_clusters": [
+            {
+                "size": len(m),
+                "heading": examples[root].get("heading"),
+                "text": examples[root]["text"][:120],
+                "urls": len(urls[root]),
+            }
+            for root, m in largest
+            if len(m) > 1
+        ],
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+    json.dump(report, open(args.report, "w"), indent=2)
+
+    print(
+        f"Collapsed {num_in} chunks -> {num_out} "
+        f"({report['shrink_ratio']:.1%} smaller, "
+        f"{report['collapsed_clusters']} duplicate clusters) -> {args.out}"
+    )
+    print(f"Saved: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,137 @@
+from pathlib import Path
+
 from sentence_transformers import SentenceTransformer
 import numpy as np
 
+QUERY_PREFIX = "Represent this question for retrieving relevant passages: "
+
+# torch: full-precision PyTorch. onnx: exported ONNX graph on ONNX Runtime.
+# onnx-int8: the same graph with dynamically quantized int8 weights
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_DIR = "data/models/onnx"
+# ONNX Runtime int8 kernel set: avx2, avx512, avx512_vnni or arm64
+DEFAULT_QUANTIZATION = "avx2"
+
+
+def _onnx_model(model_name, backend, threads, onnx_dir, quantization):
+    """Load (exporting on first use) an ONNX copy of `model_name` on CPU."""
+    import onnxruntime
+
+    session_options = onnxruntime.SessionOptions()
+    if threads:
+        session_options.intra_op_num_threads = threads
+        session_options.inter_op_num_threads = 1
+
+    local_dir = Path(onnx_dir) / model_name.replace("/", "__")
+    file_name = "onnx/model.onnx"
+    if backend == "onnx-int8":
+        file_name = f"onnx/model_qint8_{quantization}.onnx"
+
+    if not (local_dir / file_name).exists():
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        model = SentenceTransformer(model_name, backend="onnx", device="cpu")
+        model.save_pretrained(str(local_dir))
+        if backend == "onnx-int8":
+            export_dynamic_quantized_onnx_model(model, quantization, str(local_dir))
+
+    return SentenceTransformer(
+        str(local_dir),
+        backend="onnx",
+        device="cpu",
+        model_kwargs={
+            "file_name": file_name,
+            "provider": "CPUExecutionProvider",
+            "session_options": session_options,
+        },
+    )
+
 
 class BGEEmbedder:
-    def __init__(self, model_name="BAAI/bge-large-en"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(
+        self,
+        model_name="BAAI/bge-large-en",
+        query_cache=None,
+        backend: str = "torch",
+        threads: int | None = None,
+        onnx_dir: str = ONNX_DIR,
+        quantization: str = DEFAULT_QUANTIZATION,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedder backend: {backend}")
+        self.model_name = model_name
+        self.backend = backend
+        self.query_cache = query_cache
+        # Cached vectors are only reused by the backend that produced them
+        self.cache_name = (
+            model_name if backend == "torch" else f"{model_name}@{backend}"
+        )
+        if backend == "torch":
+            if threads:
+                import torch
+
+                torch.set_num_threads(threads)
+            self.model = SentenceTransformer(model_name)
+        else:
+            self.model = _onnx_model(
+                model_name, backend, threads, onnx_dir, quantization
+            )
         self.dim = self.model.get_sentence_embedding_dimension()
+        if query_cache is not None:
+            # A persisted cache may hold vectors of an earlier model version
+            query_cache.drop_mismatched(self.cache_name, self.dim)
 
-    def encode(self, texts: list[str]) -> np.ndarray:
+    def encode(
+        self, texts: list[str], batch_size: int = 16, show_progress_bar: bool = True
+    ) -> np.ndarray:
         vecs = self.model.encode(
             texts,
-            batch_size=16,
+            batch_size=batch_size,
             normalize_embeddings=True,
-            show_progress_bar=True,
+            show_progress_bar=show_progress_bar,
         )
         return np.asarray(vecs, dtype="float32")
 
     def encode_query(self, query: str) -> np.ndarray:
-        q = f"Represent this question for retrieving relevant passages: {query}"
+        if self.query_cache is not None:
+            cached = self.query_cache.get(self.cache_name, query)
+            if cached is not None:
+                return cached
+
+        q = f"{QUERY_PREFIX}{query}"
         v = self.model.encode(
             q,
             normalize_embeddings=True,
         )
-        return np.asarray(v, dtype="float32")
+        v = np.asarray(v, dtype="float32")
+        if self.query_cache is not None:
+            self.query_cache.put(self.cache_name, query, v)
+        return v
+
+    def encode_queries(
+        self, queries: list[str], batch_size: int | None = None
+    ) -> np.ndarray:
+        """Encode many queries, by default in a single forward pass; shape (n, dim)."""
+        out = np.empty((len(queries), self.dim), dtype="float32")
+        todo = []
+        for i, q in enumerate(queries):
+            cached = None
+            if self.query_cache is not None:
+                cached = self.query_cache.get(self.cache_name, q)
+            if cached is None:
+                todo.append(i)
+            else:
+                out[i] = cached
+
+        if todo:
+            vecs = self.model.encode(
+                [f"{QUERY_PREFIX}{queries[i]}" for i in todo],
+                batch_size=batch_size or len(todo),
+                normalize_embeddings=True,
+            )
+            vecs = np.asarray(vecs, dtype="float32").reshape(len(todo), self.dim)
+            out[todo] = vecs
+            if self.query_cache is not None:
+                for i, v in zip(todo, vecs):
+                    self.query_cache.put(self.cache_name, queries[i], v)
+        return out
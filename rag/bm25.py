@@ -0,0 +1,165 @@
+import json
+import re
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+BM25_ARRAYS = "bm25.npz"
+BM25_VOCAB = "bm25_vocab.json"
+
+# Identifier-shaped tokens keep their inner punctuation: `--dry-run=server`,
+# `apps/v1`, `kube-proxy`, `spec.replicas`
+_TOKEN = re.compile(r"-{0,2}[A-Za-z0-9_](?:[A-Za-z0-9_.\-/=:]*[A-Za-z0-9_])?")
+_PARTS = re.compile(r"[A-Za-z0-9]+")
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+[0-9]*|[A-Z]+[0-9]*|[0-9]+")
+_IDENT = re.compile(r"^-|[=/._:]|[a-z][A-Z]|[A-Za-z]-[A-Za-z]")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it my of on or "
+    "the this to what when where which why with you your".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Whole identifiers plus their word parts, lowercased.
+
+    `PodDisruptionBudget` yields poddisruptionbudget, pod, disruption, budget,
+    so exact identifiers score highest while prose still matches the parts.
+    """
+    out = []
+    for tok in _TOKEN.findall(text or ""):
+        low = tok.lower()
+        if low in STOPWORDS:
+            continue
+        out.append(low)
+        parts = [p for s in _PARTS.findall(tok) for p in _CAMEL.findall(s)]
+        if len(parts) > 1:
+            out.extend(p.lower() for p in parts if p.lower() not in STOPWORDS)
+    return out
+
+
+def is_identifier_query(query: str) -> bool:
+    """Queries that name literal identifiers (flags, kinds, commands, paths)."""
+    words = [w.strip("`'\",?") for w in (query or "").split()]
+    words = [w for w in words if w and w.lower() not in STOPWORDS]
+    if not words:
+        return False
+    idents = sum(
+        1 for w in words if _IDENT.search(w) or w.lower() in ("kubectl", "kubeadm")
+    )
+    return idents / len(words) >= 0.5 or (idents > 0 and len(words) <= 4)
+
+
+class BM25Index:
+    """Okapi BM25 over chunk text with CSR postings (term -> doc ids, tfs)."""
+
+    def __init__(self, vocab, indptr, doc_ids, tfs, doc_lens, k1=1.2, b=0.75):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.k1 = k1
+        self.b = b
+
+        n = len(doc_lens)
+        df = np.diff(indptr).astype("float32")
+        self.idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+        self.avgdl = float(doc_lens.mean()) if n else 0.0
+
+    @classmethod
+    def build(cls, texts):
+        vocab: dict[str, int] = {}
+        postings: list[list[tuple[int, int]]] = []
+        doc_lens = []
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lens.append(sum(counts.values()))
+            for term, tf in counts.items():
+                tid = vocab.setdefault(term, len(vocab))
+                if tid == len(postings):
+                    postings.append([])
+                postings[tid].append((doc_id, tf))
+
+        indptr = np.zeros(len(postings) + 1, dtype="int64")
+        indptr[1:] = np.cumsum([len(p) for p in postings])
+        flat = [pair for p in postings for pair in p]
+        doc_ids = np.array([d for d, _ in flat], dtype="int32")
+        tfs = np.array([tf for _, tf in flat], dtype="float32")
+        return cls(vocab, indptr, doc_ids, tfs, np.array(doc_lens, dtype="float32"))
+
+    def save(self, index_dir: str):
+        np.savez(
+            Path(index_dir) / BM25_ARRAYS,
+            indptr=self.indptr,
+            doc_ids=self.doc_ids,
+            tfs=self.tfs,
+            doc_lens=self.doc_lens,
+        )
+        with open(Path(index_dir) / BM25_VOCAB, "w", encoding="utf-8") as f:
+            json.dump(list(self.vocab), f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, index_dir: str):
+        data = np.load(Path(index_dir) / BM25_ARRAYS)
+        with open(Path(index_dir) / BM25_VOCAB, encoding="utf-8") as f:
+            vocab = {term: i for i, term in enumerate(json.load(f))}
+        return cls(
+            vocab, data["indptr"], data["doc_ids"], data["tfs"], data["doc_lens"]
+        )
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return (Path(index_dir) / BM25_ARRAYS).exists()
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.doc_lens), dtype="float32")
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lens / max(self.avgdl, 1e-9))
+        for term in set(tokenize(query)):
+            tid = self.vocab.get(term)
+            if tid is None:
+                continue
+            lo, hi = self.indptr[tid], self.indptr[tid + 1]
+            ids, tf = self.doc_ids[lo:hi], self.tfs[lo:hi]
+            scores[ids] += self.idf[tid] * tf * (self.k1 + 1) / (tf + norm[ids])
+        return scores
+
+    def search(
+        self, query: str, k: int = 5, mask: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Top-k (scores, ids); ids are -1 past the last matching chunk.
+
+        `mask` (bool per chunk) restricts results to the selected chunks.
+        """
+        scores = self.scores(query)
+        if mask is not None:
+            scores[~mask] = 0
+        top = np.array([], dtype="int64")
+        if len(scores):
+            kk = min(k, len(scores))
+            top = np.argpartition(-scores, kk - 1)[:kk]
+            top = top[np.argsort(-scores[top])]
+            top = top[scores[top] > 0]
+
+        out_scores = np.zeros(k, dtype="float32")
+        out_ids = np.full(k, -1, dtype="int64")
+        out_scores[: len(top)] = scores[top]
+        out_ids[: len(top)] = top
+        return out_scores, out_ids
+
+
+def rrf_fuse(rankings: list[np.ndarray], k: int, c: int = 60):
+    """Reciprocal rank fusion of id rankings (-1 = padding); top-k (scores, ids)."""
+    fused: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking):
+            if i >= 0:
+                fused[int(i)] = fused.get(int(i), 0.0) + 1.0 / (c + rank + 1)
+    top = sorted(fused.items(), key=lambda x: -x[1])[:k]
+
+    scores = np.zeros(k, dtype="float32")
+    ids = np.full(k, -1, dtype="int64")
+    for j, (i, s) in enumerate(top):
+        ids[j], scores[j] = i, s
+    return scores, ids
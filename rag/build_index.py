@@ -1,39 +1,490 @@
 import json
 import argparse
+import hashlib
+import os
+import shutil
+import time
+from collections import Counter
+from contextlib import ExitStack
 from pathlib import Path
-import faiss
+import numpy as np
 
-from rag.bge import BGEEmbedder
+from rag.bge import BACKENDS, BGEEmbedder
+from rag.bm25 import BM25Index
+from rag.embed_cache import EmbeddingCache, text_hash
+from rag.embed_pool import EmbedPool
+from rag.facets import FacetIndex
+from rag.meta_store import write_block_meta
+from rag.projection import METHODS, PCA_SAMPLE, PROJECTION, Projection
+from rag.shards import shard_dir_name, write_shards
+from rag.vector_index import (
+    DEFAULT_PQ_M,
+    DEFAULT_RERANK_FACTOR,
+    INDEX_TYPES,
+    QUANTIZED_TYPES,
+    TRAINED_TYPES,
+    add_vectors,
+    empty_index,
+    index_params,
+    load_manifest,
+    write_index,
+    write_manifest,
+)
+
+CHUNK_HASHES = "chunk_hashes.txt"
+# Checkpoint directory under --out; removed once the build completes
+BUILD_DIR = ".build"
+DEFAULT_BLOCK_SIZE = 4096
+# Rows per FAISS add() while assembling the index
+ADD_BLOCK = 65536
+# Rows sampled to train IVF centroids and SQ/PQ codebooks
+TRAIN_SAMPLE = 100_000
+
+
+def iter_chunks(paths):
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def iter_blocks(chunks, block_size: int):
+    block = []
+    for c in chunks:
+        block.append(c)
+        if len(block) == block_size:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def embed_chunks(
+    embedder: BGEEmbedder,
+    texts: list[str],
+    hashes: list[str],
+    cache=None,
+    pool: EmbedPool | None = None,
+) -> tuple[np.ndarray, dict]:
+    """Embed texts, reusing cached vectors for hashes seen in earlier builds.
+
+    With a `pool` the misses are encoded by its worker processes.
+    """
+    cached = cache.get_many(set(hashes)) if cache else {}
+
+    # Unique misses only: repeated boilerplate is embedded once
+    missing = {}
+    for h, t in zip(hashes, texts):
+        if h not in cached and h not in missing:
+            missing[h] = t
+
+    t0 = time.perf_counter()
+    fresh = {}
+    if missing:
+        if pool is not None:
+            vecs = pool.encode(list(missing.values()))
+        else:
+            vecs = embedder.encode(list(missing.values()))
+        fresh = dict(zip(missing.keys(), vecs))
+        if cache:
+            cache.put_many(fresh)
+    embed_s = time.perf_counter() - t0
+
+    vectors = np.stack([cached[h] if h in cached else fresh[h] for h in hashes])
+    stats = {
+        "chunks": len(hashes),
+        "cache_hits": sum(1 for h in hashes if h in cached),
+        "embedded": len(missing),
+        "embed_s": embed_s,
+    }
+    return vectors.astype("float32", copy=False), stats
+
+
+class BuildCheckpoint:
+    """Embedded blocks of one build, one atomically written .npy per block.
+
+    state.json pins the inputs and settings the parts were made with; if any
+    of them changed since, the old parts are discarded.
+    """
+
+    def __init__(self, out: Path, signature: dict, restart: bool = False):
+        self.dir = out / BUILD_DIR
+        state_path = self.dir / "state.json"
+        if self.dir.exists():
+            stale = restart or not state_path.exists()
+            if not stale:
+                stale = json.loads(state_path.read_text()) != signature
+            if stale:
+                print(f"Discarding checkpoint in {self.dir}, starting over")
+                shutil.rmtree(self.dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        state_path.write_text(json.dumps(signature, indent=2))
+
+    def _part(self, block: int) -> Path:
+        return self.dir / f"part-{block:06d}.npy"
+
+    def done(self, block: int) -> bool:
+        return self._part(block).exists()
+
+    def save(self, block: int, vectors: np.ndarray):
+        tmp = self._part(block).with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, vectors)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._part(block))
+
+    def load(self, block: int) -> np.ndarray:
+        return np.load(self._part(block), mmap_mode="r")
+
+    def clear(self):
+        shutil.rmtree(self.dir)
+
+
+def input_signature(args, cache_name: str) -> dict:
+    inputs = []
+    for p in args.chunks:
+        st = os.stat(p)
+        inputs.append([str(Path(p).resolve()), st.st_size, st.st_mtime_ns])
+    return {"inputs": inputs, "block_size": args.block_size, "model": cache_name}
+
+
+def embed_pass(args, checkpoint, embedder, cache, pool) -> tuple[dict, Counter]:
+    """Stream the chunks once, embedding every block without a saved part."""
+    stats = {"chunks": 0, "resumed": 0, "cache_hits": 0, "embedded": 0}
+    stats["embed_s"] = 0.0
+    refs = Counter()
+    for b, block in enumerate(iter_blocks(iter_chunks(args.chunks), args.block_size)):
+        for c in block:
+            if args.shard_by_ref and not c.get("source_ref"):
+                raise SystemExit(
+                    f"--shard-by-ref: chunk {stats['chunks']} has no source_ref"
+                )
+            refs[c.get("source_ref")] += 1
+            stats["chunks"] += 1
+        if checkpoint.done(b):
+            stats["resumed"] += len(block)
+            continue
+
+        texts = [c["text"] for c in block]
+        hashes = [text_hash(t) for t in texts]
+        vecs, block_stats = embed_chunks(embedder, texts, hashes, cache, pool)
+        checkpoint.save(b, vecs)
+        for key in ("cache_hits", "embedded", "embed_s"):
+            stats[key] += block_stats[key]
+        print(
+            f"Block {b}: {len(block)} chunks, {block_stats['cache_hits']} cached, "
+            f"{block_stats['embedded']} embedded"
+        )
+    return stats, refs
+
+
+def sample_vectors(checkpoint, num_rows: int, block_size: int, size: int):
+    """Fixed-seed random sample of up to `size` embedded rows, in row order."""
+    rng = np.random.default_rng(0)
+    rows = np.sort(rng.choice(num_rows, size=min(num_rows, size), replace=False))
+    blocks = rows // block_size
+    return np.concatenate(
+        [
+            checkpoint.load(b)[rows[blocks == b] - b * block_size]
+            for b in np.unique(blocks)
+        ]
+    )
+
+
+def assemble_vectors(args, checkpoint, dim: int, targets: dict, key=None, proj=None):
+    """Copy the block parts into one vectors.npy per target directory.
+
+    `targets` maps a key to (directory, rows); `key(chunk)` picks the target
+    of each chunk, in input order (default: the single target None). With a
+    projection `proj`, the stored vectors are the projected ones.
+    """
+    outs, pos = {}, {}
+    for k, (out, rows) in targets.items():
+        out.mkdir(parents=True, exist_ok=True)
+        outs[k] = np.lib.format.open_memmap(
+            out / "vectors.npy", mode="w+", dtype="float32", shape=(rows, dim)
+        )
+        pos[k] = 0
+
+    for b, block in enumerate(iter_blocks(iter_chunks(args.chunks), args.block_size)):
+        vecs = checkpoint.load(b)
+        if proj is not None:
+            vecs = proj.apply(vecs)
+        keys = [key(c) if key else None for c in block]
+        for k in set(keys):
+            rows = [i for i, kk in enumerate(keys) if kk == k]
+            outs[k][pos[k] : pos[k] + len(rows)] = vecs[rows]
+            pos[k] += len(rows)
+    for mm in outs.values():
+        mm.flush()
+
+
+def build_index_dir(out: Path, chunks, args, stats, proj=None) -> dict:
+    """Write index, metadata, facets, BM25 and manifest for out/vectors.npy.
+
+    `chunks()` yields the chunks behind the rows of vectors.npy, in order; it
+    is streamed a few times rather than held in memory. `proj` is saved next
+    to the index so queries are projected the same way.
+    """
+    # Full-precision vectors: exact re-ranking (memory-mapped at query time)
+    # and ground truth for ANN recall reports
+    vectors = np.load(out / "vectors.npy", mmap_mode="r")
+    n, dim = vectors.shape
+    index = empty_index(
+        dim,
+        args.index_type,
+        n,
+        nlist=args.nlist,
+        hnsw_m=args.hnsw_m,
+        ef_construction=args.ef_construction,
+        pq_m=args.pq_m,
+    )
+    if args.index_type in TRAINED_TYPES:
+        size = TRAIN_SAMPLE
+        if args.index_type == "ivf":
+            size = max(size, 50 * index.nlist)
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(n, size=min(n, size), replace=False))
+        index.train(np.ascontiguousarray(vectors[sample]))
+    for lo in range(0, n, ADD_BLOCK):
+        add_vectors(
+            index, args.index_type, np.ascontiguousarray(vectors[lo : lo + ADD_BLOCK])
+        )
+
+    previous = load_manifest(out)
+    write_index(index, str(out / "index.faiss"), args.index_type)
+
+    # Same key the embedding cache uses: model, plus the backend unless torch
+    version = hashlib.sha256(f"{stats['cache_name']}\n{args.index_type}".encode())
+    if proj is not None:
+        proj.save(out)
+        version.update(f"\n{proj.method}:{proj.dim}".encode())
+    else:
+        (out / PROJECTION).unlink(missing_ok=True)
+    refs = set()
+    with open(out / CHUNK_HASHES, "w", encoding="utf-8") as f:
+        for c in chunks():
+            h = text_hash(c["text"])
+            f.write(h + "\n")
+            version.update(f"\n{h}".encode())
+            refs.add(c.get("source_ref"))
+
+    write_block_meta(out, chunks())
+    FacetIndex.build(chunks()).save(out)
+    BM25Index.build(f"{c.get('heading') or ''}\n{c['text']}" for c in chunks()).save(
+        out
+    )
+
+    # Per-chunk encode cost of this run, or of the last run that embedded anything
+    if stats["embedded"]:
+        sec_per_chunk = stats["embed_s"] / stats["embedded"]
+    else:
+        sec_per_chunk = previous.get("embed_seconds_per_chunk")
+
+    manifest = {
+        "version": version.hexdigest()[:16],
+        "model": stats["model"],
+        "embed_backend": stats["embed_backend"],
+        "chunk_hashes": CHUNK_HASHES,
+        "embed_seconds_per_chunk": sec_per_chunk,
+        "index_type": args.index_type,
+        "params": index_params(index),
+        "dim": dim,
+        "num_vectors": index.ntotal,
+        "index_bytes_per_chunk": round(
+            (out / "index.faiss").stat().st_size / max(index.ntotal, 1), 1
+        ),
+    }
+    if proj is not None:
+        manifest["projection"] = proj.info()
+    if len(refs) == 1 and None not in refs:
+        manifest["source_ref"] = refs.pop()
+    if args.index_type in QUANTIZED_TYPES:
+        manifest["rerank_factor"] = (
+            args.rerank_factor or DEFAULT_RERANK_FACTOR[args.index_type]
+        )
+    write_manifest(out, manifest)
+    return manifest
 
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--chunks", required=True)
+    ap.add_argument(
+        "--chunks", required=True, nargs="+", help="One or more chunk JSONL files"
+    )
     ap.add_argument("--out", required=True)
+    ap.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    ap.add_argument(
+        "--nlist", type=int, default=None, help="IVF lists (default ~4*sqrt(N))"
+    )
+    ap.add_argument("--hnsw-m", type=int, default=32)
+    ap.add_argument("--ef-construction", type=int, default=200)
+    ap.add_argument("--pq-m", type=int, default=DEFAULT_PQ_M, help="PQ sub-quantizers")
+    ap.add_argument(
+        "--rerank-factor",
+        type=int,
+        default=None,
+        help="Candidates per result re-scored exactly (quantized types only)",
+    )
+    ap.add_argument("--embed-cache", default="data/embed_cache/embeddings.sqlite")
+    ap.add_argument("--no-embed-cache", action="store_true")
+    ap.add_argument(
+        "--model",
+        default="BAAI/bge-large-en",
+        help="Embedding model, e.g. BAAI/bge-small-en-v1.5 for a cascade index",
+    )
+    ap.add_argument("--embed-backend", choices=BACKENDS, default="torch")
+    ap.add_argument("--embed-threads", type=int, default=None)
+    ap.add_argument(
+        "--workers", type=int, default=1, help="Embedding processes (1 = in-process)"
+    )
+    ap.add_argument(
+        "--worker-threads",
+        type=int,
+        default=None,
+        help="Threads per embedding process (default cores / workers)",
+    )
+    ap.add_argument(
+        "--dim",
+        type=int,
+        default=None,
+        help="Index dimension below the model's, e.g. 256 or 384",
+    )
+    ap.add_argument(
+        "--projection",
+        choices=METHODS,
+        default="pca",
+        help="How --dim is reached: PCA fitted on the corpus, or truncation",
+    )
+    ap.add_argument(
+        "--block-size",
+        type=int,
+        default=DEFAULT_BLOCK_SIZE,
+        help="Chunks embedded and checkpointed together",
+    )
+    ap.add_argument(
+        "--restart",
+        action="store_true",
+        help="Discard blocks embedded by an interrupted run",
+    )
+    ap.add_argument(
+        "--shard-by-ref",
+        action="store_true",
+        help="One index per source_ref under --out, routed by version at query time",
+    )
+    ap.add_argument(
+        "--default-ref", default=None, help="Shard for requests without a version"
+    )
     args = ap.parse_args()
 
-    chunks = []
-    with open(args.chunks, encoding="utf-8") as f:
-        for line in f:
-            c = json.loads(line)
-            chunks.append(c)
+    out = Path(args.out)
+    embedder = BGEEmbedder(
+        args.model, backend=args.embed_backend, threads=args.embed_threads
+    )
+    if args.dim is not None and not 0 < args.dim < embedder.dim:
+        ap.error(f"--dim must be below the model dimension ({embedder.dim})")
+    checkpoint = BuildCheckpoint(
+        out, input_signature(args, embedder.cache_name), args.restart
+    )
 
-    texts = [c["text"] for c in chunks]
+    # Chunks are read and embedded one block at a time and every finished block
+    # is saved, so an interrupted run resumes at the first missing block. All
+    # shards are embedded in one pass; chunks shared across releases hit the
+    # cache or the in-block dedup
+    with ExitStack() as stack:
+        cache = None
+        if not args.no_embed_cache:
+            cache = EmbeddingCache(args.embed_cache, embedder.cache_name)
+            stack.callback(cache.close)
+        pool = None
+        if args.workers > 1:
+            pool = stack.enter_context(
+                EmbedPool(
+                    embedder.model_name,
+                    args.workers,
+                    threads=args.worker_threads,
+                    backend=embedder.backend,
+                )
+            )
+        stats, refs = embed_pass(args, checkpoint, embedder, cache, pool)
+    stats["model"] = embedder.model_name
+    stats["embed_backend"] = embedder.backend
+    stats["cache_name"] = embedder.cache_name
 
-    embedder = BGEEmbedder()
-    vectors = embedder.encode(texts)
+    looked_up = stats["chunks"] - stats["resumed"]
+    hit_ratio = stats["cache_hits"] / max(looked_up, 1)
+    print(
+        f"Embedding cache: {stats['cache_hits']}/{looked_up} hits "
+        f"({hit_ratio:.1%}), embedded {stats['embedded']} in {stats['embed_s']:.1f}s"
+    )
+    if stats["resumed"]:
+        print(f"Resumed {stats['resumed']} chunks from {checkpoint.dir}")
 
-    index = faiss.IndexFlatIP(embedder.dim)
-    index.add(vectors)
+    # One projection for every shard, so they share a query vector
+    proj = None
+    dim = embedder.dim
+    if args.dim:
+        if args.projection == "pca":
+            sample = sample_vectors(
+                checkpoint, stats["chunks"], args.block_size, PCA_SAMPLE
+            )
+            proj = Projection.fit_pca(sample, args.dim)
+        else:
+            proj = Projection(args.projection, embedder.dim, args.dim)
+        dim = args.dim
+        print(f"Projecting {embedder.dim} -> {dim} dims ({args.projection})")
 
-    out = Path(args.out)
-    out.mkdir(parents=True, exist_ok=True)
-    faiss.write_index(index, str(out / "index.faiss"))
+    if not args.shard_by_ref:
+        assemble_vectors(
+            args, checkpoint, dim, {None: (out, stats["chunks"])}, proj=proj
+        )
+        manifest = build_index_dir(
+            out, lambda: iter_chunks(args.chunks), args, stats, proj
+        )
+        checkpoint.clear()
+        sec_per_chunk = manifest["embed_seconds_per_chunk"]
+        saved = stats["cache_hits"] * sec_per_chunk if sec_per_chunk else 0.0
+        print(f"Embedding cache saved ~{saved:.1f}s")
+        print(
+            f"Indexed {stats['chunks']} MD chunks ({embedder.model_name}, "
+            f"{args.index_type}, {manifest['index_bytes_per_chunk']} bytes/chunk)"
+        )
+        return
+
+    if args.default_ref and args.default_ref not in refs:
+        raise SystemExit(f"--default-ref {args.default_ref} has no chunks")
+
+    assemble_vectors(
+        args,
+        checkpoint,
+        dim,
+        {ref: (out / shard_dir_name(ref), rows) for ref, rows in refs.items()},
+        key=lambda c: c["source_ref"],
+        proj=proj,
+    )
 
-    with open(out / "meta.json", "w", encoding="utf-8") as f:
-        json.dump(chunks, f, ensure_ascii=False)
+    def shard_chunks(ref):
+        return lambda: (c for c in iter_chunks(args.chunks) if c["source_ref"] == ref)
 
-    print(f"Indexed {len(chunks)} MD chunks (bge-large-en)")
+    shards = {}
+    for ref, rows in refs.items():
+        manifest = build_index_dir(
+            out / shard_dir_name(ref), shard_chunks(ref), args, stats, proj
+        )
+        shards[ref] = {
+            "dir": shard_dir_name(ref),
+            "version": manifest["version"],
+            "num_vectors": manifest["num_vectors"],
+        }
+        print(
+            f"Indexed {rows} chunks for {ref} ({args.index_type}, "
+            f"{manifest['index_bytes_per_chunk']} bytes/chunk)"
+        )
+    write_shards(out, embedder.model_name, shards, args.default_ref)
+    checkpoint.clear()
+    print(f"Wrote {len(shards)} shards to {out}")
 
 
 if __name__ == "__main__":
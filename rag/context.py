@@ -0,0 +1,119 @@
+from functools import lru_cache
+
+from transformers import AutoTokenizer
+
+from rag.embed_cache import text_hash
+
+DEFAULT_TOKENIZER = "Qwen/Qwen2.5-7B-Instruct"
+# Context tokens per prompt, about what the 6000-char cut used to send
+DEFAULT_CONTEXT_TOKENS = 1536
+# A cut-off last part shorter than this is left out rather than sent
+MIN_PARTIAL_TOKENS = 32
+SEPARATOR = "\n\n"
+
+
+class ContextPacker:
+    """Builds the prompt context from ranked chunks within a token budget.
+
+    Tokens are counted with the serving model's tokenizer, and the count of
+    every part is cached, so a chunk seen before costs a dict lookup. Only
+    the one part that gets cut is tokenized again.
+    Chunks from one page section (same url and anchor) are merged under a
+    single heading at the rank of their best member, and chunks whose text
+    is already in the context are dropped. Parts are added best first until
+    the budget is full; the part that does not fit is cut on a token
+    boundary.
+    """
+
+    def __init__(
+        self,
+        tokenizer_name: str = DEFAULT_TOKENIZER,
+        budget: int = DEFAULT_CONTEXT_TOKENS,
+        cache_size: int = 100_000,
+        tokenizer=None,
+    ):
+        self.tokenizer = tokenizer or AutoTokenizer.from_pretrained(tokenizer_name)
+        self.budget = budget
+        self._count = lru_cache(maxsize=cache_size)(self._count_tokens)
+
+    def _encode(self, text: str) -> list[int]:
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def _count_tokens(self, text: str) -> int:
+        return len(self._encode(text))
+
+    def count(self, text: str) -> int:
+        return self._count(text)
+
+    def chat_tokens(self, messages: list[dict]) -> int:
+        """Prefill tokens of a chat prompt, template included."""
+        return len(
+            self.tokenizer.apply_chat_template(
+                messages, tokenize=True, add_generation_prompt=True
+            )
+        )
+
+    def parts(
+        self, results: list[dict], canonical: bool = False
+    ) -> list[tuple[str, str]]:
+        """Deduplicated, section-merged (order key, part) pairs in rank order.
+
+        With `canonical`, chunks inside a section follow chunk_id order too.
+        """
+        sections: dict[tuple, list[tuple[str, str]]] = {}
+        seen, kept = set(), []
+        for r in results:
+            text = r.get("text") or ""
+            h = text_hash(text)
+            if not text or h in seen or any(text in t for t in kept):
+                continue
+            seen.add(h)
+            kept.append(text)
+            key = (r.get("url") or r.get("chunk_id") or h, r.get("heading") or "")
+            sections.setdefault(key, []).append((r.get("chunk_id") or h, text))
+
+        out = []
+        for (_, heading), members in sections.items():
+            if canonical:
+                members = sorted(members)
+            body = SEPARATOR.join(text for _, text in members)
+            part = f"## {heading}\n{body}" if heading else body
+            out.append((min(cid for cid, _ in members), part))
+        return out
+
+    def _cut(self, text: str, max_tokens: int) -> str:
+        # A token cut can split a multi-byte character
+        return self.tokenizer.decode(self._encode(text)[:max_tokens]).rstrip("�")
+
+    def pack(
+        self, results: list[dict], budget: int | None = None, canonical: bool = False
+    ) -> str:
+        """Context of the best parts that fit `budget` tokens.
+
+        Parts are chosen by rank either way. With `canonical` the chosen parts
+        are laid out in chunk_id order, so requests retrieving overlapping
+        chunks start with the same text and share vLLM's prefix cache.
+        """
+        budget = self.budget if budget is None else budget
+        sep = self.count(SEPARATOR)
+        out, used = [], 0
+        for key, part in self.parts(results, canonical):
+            cost = self.count(part) + (sep if out else 0)
+            if used + cost <= budget:
+                out.append((key, part))
+                used += cost
+                continue
+            remaining = budget - used - (sep if out else 0)
+            if remaining >= MIN_PARTIAL_TOKENS:
+                out.append((key, self._cut(part, remaining)))
+            break
+
+        if canonical:
+            out.sort()
+        context = SEPARATOR.join(part for _, part in out)
+        # Parts are counted one by one; tokens can merge across a separator,
+        # so check the joined text once and trim any overshoot
+        ids = self._encode(context)
+        if len(ids) > budget:
+            context = self._cut(context, budget)
+        return context
@@ -0,0 +1,66 @@
+import hashlib
+import re
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+_WS = re.compile(r"\s+")
+
+# SQLite's default cap on bound parameters is 999
+_BATCH = 900
+
+
+def normalize_text(text: str) -> str:
+    return _WS.sub(" ", (text or "").strip())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent (model, text hash) -> vector store backed by SQLite.
+
+    Shared by every index build, so moving between doc releases only embeds
+    chunks whose normalized text actually changed.
+    """
+
+    def __init__(self, path: str, model_name: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " vec BLOB NOT NULL,"
+            " PRIMARY KEY (model, hash))"
+        )
+
+    def get_many(self, hashes) -> dict[str, np.ndarray]:
+        hashes = list(hashes)
+        found = {}
+        for start in range(0, len(hashes), _BATCH):
+            batch = hashes[start : start + _BATCH]
+            rows = self.conn.execute(
+                "SELECT hash, vec FROM embeddings WHERE model = ? AND hash IN "
+                f"({','.join('?' * len(batch))})",
+                [self.model_name, *batch],
+            )
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype="float32")
+        return found
+
+    def put_many(self, items: dict[str, np.ndarray]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vec) VALUES (?, ?, ?)",
+                [
+                    (self.model_name, h, np.asarray(v, dtype="float32").tobytes())
+                    for h, v in items.items()
+                ],
+            )
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,101 @@
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from rag.bge import BGEEmbedder
+
+# Pieces per worker: small enough to even out stragglers, large enough that
+# each piece fills several batches
+PIECES_PER_WORKER = 4
+
+_embedder: BGEEmbedder | None = None
+_batch_size = 16
+
+
+def default_threads(workers: int) -> int:
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def length_pieces(texts: list[str], num_pieces: int) -> list[np.ndarray]:
+    """Split row ids into pieces of similar total length, each sorted by length.
+
+    Dealing the length-sorted rows round-robin gives every piece the same mix
+    of short and long texts, and keeps neighbours within a piece close in
+    length so a batch pads to roughly its own longest text.
+    """
+    order = np.argsort([len(t) for t in texts], kind="stable")
+    return [order[i::num_pieces] for i in range(num_pieces) if i < len(order)]
+
+
+def _init_worker(model_name: str, backend: str, threads: int, batch_size: int):
+    global _embedder, _batch_size
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    _embedder = BGEEmbedder(model_name, backend=backend, threads=threads)
+    _batch_size = batch_size
+
+
+def _encode_piece(texts: list[str]) -> np.ndarray:
+    return _embedder.encode(texts, batch_size=_batch_size, show_progress_bar=False)
+
+
+class EmbedPool:
+    """Worker processes that each load the model once and encode pieces.
+
+    Use as a context manager; encode() can be called many times, e.g. once
+    per block of a streaming build.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        workers: int,
+        threads: int | None = None,
+        backend: str = "torch",
+        batch_size: int = 16,
+    ):
+        self.workers = workers
+        self.threads = threads or default_threads(workers)
+        # spawn, not fork: torch and tokenizer thread pools don't survive a fork
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, backend, self.threads, batch_size),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._pool.shutdown()
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        """Rows come back in input order. Progress is left to the caller:
+        build_index reports each block it embeds."""
+        pieces = length_pieces(texts, self.workers * PIECES_PER_WORKER)
+        futures = [
+            (rows, self._pool.submit(_encode_piece, [texts[i] for i in rows]))
+            for rows in pieces
+        ]
+        out = None
+        for rows, fut in futures:
+            vecs = fut.result()
+            if out is None:
+                out = np.empty((len(texts), vecs.shape[1]), dtype="float32")
+            out[rows] = vecs
+        return out
+
+
+def encode_parallel(
+    texts: list[str],
+    model_name: str,
+    workers: int,
+    threads: int | None = None,
+    backend: str = "torch",
+    batch_size: int = 16,
+) -> np.ndarray:
+    """Embed `texts` across `workers` processes; rows come back in input order."""
+    with EmbedPool(model_name, workers, threads, backend, batch_size) as pool:
+        return pool.encode(texts)
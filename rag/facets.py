@@ -0,0 +1,104 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+FACET_BITMAPS = "facets.npy"
+FACET_KEYS = "facets.json"
+
+FACET_FIELDS = ("doc_type", "source_ref", "breadcrumb")
+
+
+def facet_keys(chunk: dict) -> list[str]:
+    """`field=value` keys a chunk matches; breadcrumbs match every path prefix.
+
+    A chunk that ingest.dedup collapsed near-duplicates into also matches the
+    doc_type / breadcrumb values of those duplicates (`member_facets`).
+    """
+    keys = []
+    for c in (chunk, *chunk.get("member_facets", ())):
+        for field in ("doc_type", "source_ref"):
+            if c.get(field):
+                keys.append(f"{field}={c[field]}")
+        breadcrumb = c.get("breadcrumb") or []
+        for depth in range(1, len(breadcrumb) + 1):
+            keys.append(f"breadcrumb={'/'.join(breadcrumb[:depth])}")
+    return list(dict.fromkeys(keys))
+
+
+class FacetIndex:
+    """One precomputed id bitmap per facet value.
+
+    Bitmaps are little-endian packed bits, the layout faiss.IDSelectorBitmap
+    reads, so a combined filter goes straight into FAISS search parameters.
+    """
+
+    def __init__(self, keys: list[str], bitmaps: np.ndarray, num_rows: int):
+        self.keys = {key: j for j, key in enumerate(keys)}
+        self.bitmaps = bitmaps
+        self.num_rows = num_rows
+
+    @classmethod
+    def build(cls, chunks):
+        rows: dict[str, list[int]] = {}
+        num_rows = 0
+        for i, chunk in enumerate(chunks):
+            for key in facet_keys(chunk):
+                rows.setdefault(key, []).append(i)
+            num_rows = i + 1
+
+        keys = sorted(rows)
+        bitmaps = np.zeros((len(keys), (num_rows + 7) // 8), dtype="uint8")
+        for j, key in enumerate(keys):
+            mask = np.zeros(num_rows, dtype=bool)
+            mask[rows[key]] = True
+            bitmaps[j] = np.packbits(mask, bitorder="little")
+        return cls(keys, bitmaps, num_rows)
+
+    def save(self, index_dir: str):
+        np.save(Path(index_dir) / FACET_BITMAPS, self.bitmaps)
+        with open(Path(index_dir) / FACET_KEYS, "w", encoding="utf-8") as f:
+            json.dump({"num_rows": self.num_rows, "keys": list(self.keys)}, f)
+
+    @classmethod
+    def load(cls, index_dir: str):
+        with open(Path(index_dir) / FACET_KEYS, encoding="utf-8") as f:
+            data = json.load(f)
+        bitmaps = np.load(Path(index_dir) / FACET_BITMAPS, mmap_mode="r")
+        return cls(data["keys"], bitmaps, data["num_rows"])
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return (Path(index_dir) / FACET_KEYS).exists()
+
+    def values(self, field: str) -> list[str]:
+        prefix = f"{field}="
+        return [k[len(prefix) :] for k in self.keys if k.startswith(prefix)]
+
+    def bitmap(self, filters: dict) -> np.ndarray | None:
+        """AND across fields, OR across the values given for one field.
+
+        Returns None when no filter applies.
+        """
+        combined = None
+        for field, values in filters.items():
+            if values is None:
+                continue
+            if field not in FACET_FIELDS:
+                raise ValueError(f"Unknown filter field: {field}")
+            if isinstance(values, str):
+                values = [values]
+
+            field_bits = np.zeros(self.bitmaps.shape[1], dtype="uint8")
+            for value in values:
+                j = self.keys.get(f"{field}={value.strip('/')}")
+                if j is not None:
+                    field_bits |= self.bitmaps[j]
+            combined = field_bits if combined is None else combined & field_bits
+        return combined
+
+    def mask(self, bitmap: np.ndarray) -> np.ndarray:
+        return np.unpackbits(bitmap, bitorder="little")[: self.num_rows].astype(bool)
+
+    def ids(self, bitmap: np.ndarray) -> np.ndarray:
+        return np.flatnonzero(self.mask(bitmap))
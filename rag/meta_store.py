@@ -0,0 +1,226 @@
+import argparse
+import json
+import mmap
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+META_JSON = "meta.json"
+META_SCHEMA = "meta.schema.json"
+META_BLOCKS = "meta.blocks"
+META_BLOCK_INDEX = "meta.blocks.idx.npy"
+
+DEFAULT_BLOCK_SIZE = 128
+
+
+class BlockMetaWriter:
+    """Columnar chunk metadata, compressed per block.
+
+    Rows are grouped into blocks of `block_size`; within a block each field is
+    stored as its own zlib-compressed JSON array, so a lookup only inflates the
+    fields it asks for. (block, field) -> (offset, length) goes to a uint64
+    array that readers memory-map.
+
+    Without `fields`, the columns are the union of the keys of all rows; a
+    field first seen after some blocks were written reads as None there.
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        fields: list[str] | None = None,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+    ):
+        self.index_dir = Path(index_dir)
+        self.fields = list(fields) if fields is not None else []
+        self._infer_fields = fields is None
+        self._known = set(self.fields)
+        self.block_size = block_size
+        self.num_rows = 0
+        self._buf: list[dict] = []
+        self._offsets: list[list[tuple[int, int]]] = []
+        self._f = open(self.index_dir / META_BLOCKS, "wb")
+        self._pos = 0
+
+    def add(self, row: dict):
+        if self._infer_fields and not self._known.issuperset(row):
+            self.fields.extend(k for k in row if k not in self._known)
+            self._known.update(row)
+        self._buf.append(row)
+        self.num_rows += 1
+        if len(self._buf) == self.block_size:
+            self._flush()
+
+    def _flush(self):
+        block = []
+        for field in self.fields:
+            column = [row.get(field) for row in self._buf]
+            data = zlib.compress(json.dumps(column, ensure_ascii=False).encode("utf-8"))
+            self._f.write(data)
+            block.append((self._pos, len(data)))
+            self._pos += len(data)
+        self._offsets.append(block)
+        self._buf = []
+
+    def _pad(self):
+        """All-None columns for fields that appeared after a block was written;
+        such blocks were full, since only the last block can be short."""
+        empty = zlib.compress(json.dumps([None] * self.block_size).encode("utf-8"))
+        for block in self._offsets:
+            while len(block) < len(self.fields):
+                self._f.write(empty)
+                block.append((self._pos, len(empty)))
+                self._pos += len(empty)
+
+    def close(self):
+        if self._buf:
+            self._flush()
+        self._pad()
+        self._f.close()
+
+        offsets = np.asarray(self._offsets, dtype="uint64").reshape(
+            len(self._offsets), len(self.fields), 2
+        )
+        np.save(self.index_dir / META_BLOCK_INDEX, offsets)
+        with open(self.index_dir / META_SCHEMA, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "fields": self.fields,
+                    "block_size": self.block_size,
+                    "num_rows": self.num_rows,
+                },
+                f,
+                indent=2,
+            )
+
+
+def write_block_meta(index_dir: str, rows, block_size: int = DEFAULT_BLOCK_SIZE):
+    writer = BlockMetaWriter(index_dir, block_size=block_size)
+    for row in rows:
+        writer.add(row)
+    writer.close()
+
+
+class BlockMetaStore:
+    """Read-only, memory-mapped view over a BlockMetaWriter store.
+
+    Opening maps two files regardless of corpus size. Pages live in the OS
+    page cache, so every server worker mapping the same store shares one
+    copy; only recently decoded columns are kept as Python objects.
+    """
+
+    def __init__(self, index_dir: str, cache_size: int = 256):
+        with open(Path(index_dir) / META_SCHEMA, encoding="utf-8") as f:
+            schema = json.load(f)
+        self.fields = schema["fields"]
+        self.block_size = schema["block_size"]
+        self._num_rows = schema["num_rows"]
+        self._field_pos = {name: j for j, name in enumerate(self.fields)}
+
+        self._file = open(Path(index_dir) / META_BLOCKS, "rb")
+        self._mm = None
+        if self._num_rows:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._index = np.load(Path(index_dir) / META_BLOCK_INDEX, mmap_mode="r")
+
+        self._cache: OrderedDict[tuple[int, int], list] = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._num_rows
+
+    def _column(self, block: int, j: int) -> list:
+        key = (block, j)
+        with self._lock:
+            column = self._cache.get(key)
+            if column is not None:
+                self._cache.move_to_end(key)
+                return column
+
+        offset, length = (int(x) for x in self._index[block, j])
+        column = json.loads(zlib.decompress(self._mm[offset : offset + length]))
+
+        with self._lock:
+            self._cache[key] = column
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return column
+
+    def get(self, i: int, fields=None) -> dict:
+        if not 0 <= i < self._num_rows:
+            raise IndexError(i)
+        block, row = divmod(i, self.block_size)
+        return {
+            name: self._column(block, self._field_pos[name])[row]
+            for name in (fields or self.fields)
+            if name in self._field_pos
+        }
+
+    def __getitem__(self, i: int) -> dict:
+        return self.get(i)
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+
+class InMemoryMetaStore:
+    """Legacy meta.json loaded whole; same interface as BlockMetaStore."""
+
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def get(self, i: int, fields=None) -> dict:
+        row = self.rows[i]
+        if fields is None:
+            return dict(row)
+        return {name: row[name] for name in fields if name in row}
+
+    def __getitem__(self, i: int) -> dict:
+        return self.get(i)
+
+    def close(self):
+        pass
+
+
+def open_meta_store(index_dir: str):
+    if (Path(index_dir) / META_SCHEMA).exists():
+        return BlockMetaStore(index_dir)
+    # Indexes built before the block store existed only have meta.json
+    with open(Path(index_dir) / META_JSON, encoding="utf-8") as f:
+        return InMemoryMetaStore(json.load(f))
+
+
+def main():
+    """Export an existing meta.json into the block store next to it."""
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--meta", required=True, help="Path to meta.json")
+    ap.add_argument("--out", default=None, help="Defaults to the meta.json directory")
+    ap.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+    args = ap.parse_args()
+
+    meta_path = Path(args.meta)
+    out = Path(args.out) if args.out else meta_path.parent
+    out.mkdir(parents=True, exist_ok=True)
+
+    with open(meta_path, encoding="utf-8") as f:
+        rows = json.load(f)
+    write_block_meta(out, rows, block_size=args.block_size)
+
+    size = (out / META_BLOCKS).stat().st_size
+    print(
+        f"Exported {len(rows)} rows: {meta_path.stat().st_size:,} -> {size:,} bytes "
+        f"({size / max(len(rows), 1):.0f} bytes/row)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+from pathlib import Path
+
+import numpy as np
+
+PROJECTION = "projection.npz"
+
+# pca: centre on the corpus mean and keep the top principal components.
+# truncate: keep the leading dims (Matryoshka-style)
+METHODS = ("pca", "truncate")
+# Rows sampled to fit PCA
+PCA_SAMPLE = 100_000
+
+
+class Projection:
+    """Maps model embeddings down to the index dimension.
+
+    Projected vectors are renormalized, so inner product is still cosine
+    similarity. The same map is applied to chunks at build time and to
+    queries at search time.
+    """
+
+    def __init__(
+        self,
+        method: str,
+        dim_in: int,
+        dim: int,
+        mean: np.ndarray | None = None,
+        components: np.ndarray | None = None,
+    ):
+        if method not in METHODS:
+            raise ValueError(f"Unknown projection method: {method}")
+        if not 0 < dim < dim_in:
+            raise ValueError(f"Projection dim must be in (0, {dim_in}), got {dim}")
+        self.method = method
+        self.dim_in = dim_in
+        self.dim = dim
+        self.mean = mean
+        # (dim_in, dim); None for truncation
+        self.components = components
+
+    @classmethod
+    def fit_pca(cls, sample: np.ndarray, dim: int):
+        """PCA projection fitted on an (n, dim_in) sample of chunk vectors."""
+        mean = sample.mean(axis=0, dtype="float64")
+        # Covariance is (dim_in, dim_in) whatever the sample size; accumulate
+        # it in float64 a slice at a time
+        cov = np.zeros((sample.shape[1], sample.shape[1]))
+        for lo in range(0, len(sample), 8192):
+            x = sample[lo : lo + 8192] - mean
+            cov += x.T @ x
+        # eigh sorts ascending: the last `dim` eigenvectors are the top axes
+        _, vecs = np.linalg.eigh(cov)
+        return cls(
+            "pca",
+            sample.shape[1],
+            dim,
+            mean.astype("float32"),
+            np.ascontiguousarray(vecs[:, ::-1][:, :dim], dtype="float32"),
+        )
+
+    def apply(self, vecs: np.ndarray) -> np.ndarray:
+        vecs = np.asarray(vecs, dtype="float32").reshape(-1, self.dim_in)
+        if self.method == "pca":
+            out = (vecs - self.mean) @ self.components
+        else:
+            out = np.array(vecs[:, : self.dim])
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+    def info(self) -> dict:
+        return {"method": self.method, "dim_in": self.dim_in, "dim": self.dim}
+
+    def save(self, index_dir: str):
+        arrays = {}
+        if self.method == "pca":
+            arrays = {"mean": self.mean, "components": self.components}
+        np.savez(
+            Path(index_dir) / PROJECTION,
+            method=self.method,
+            shape=np.array([self.dim_in, self.dim]),
+            **arrays,
+        )
+
+    @classmethod
+    def load(cls, index_dir: str):
+        data = np.load(Path(index_dir) / PROJECTION)
+        method = str(data["method"])
+        dim_in, dim = (int(x) for x in data["shape"])
+        if method != "pca":
+            return cls(method, dim_in, dim)
+        return cls(method, dim_in, dim, data["mean"], data["components"])
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return (Path(index_dir) / PROJECTION).exists()
@@ -0,0 +1,107 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case, whitespace and trailing punctuation don't change what is asked."""
+    return _WS.sub(" ", (query or "").strip().lower()).rstrip("?!. ")
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU of query vectors keyed by (model name, normalized query).
+
+    With `path` set, entries are loaded on startup and written back by save(),
+    so restarts and eval reruns start warm.
+    """
+
+    def __init__(self, maxsize: int = 10000, path: str | None = None):
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        if path and Path(path).exists():
+            self.load()
+
+    @staticmethod
+    def _key(model_name: str, query: str) -> str:
+        return f"{model_name}\0{normalize_query(query)}"
+
+    def get(self, model_name: str, query: str) -> np.ndarray | None:
+        key = self._key(model_name, query)
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, model_name: str, query: str, vec: np.ndarray):
+        key = self._key(model_name, query)
+        with self._lock:
+            self._entries[key] = np.asarray(vec, dtype="float32")
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def drop_mismatched(self, model_name: str, dim: int) -> int:
+        """Forget `model_name` vectors that aren't `dim` long, e.g. loaded from
+        a file written before the model changed; returns how many."""
+        prefix = f"{model_name}\0"
+        with self._lock:
+            stale = [
+                k
+                for k, v in self._entries.items()
+                if k.startswith(prefix) and v.shape != (dim,)
+            ]
+            for k in stale:
+                del self._entries[k]
+        return len(stale)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def load(self):
+        data = np.load(self.path)
+        # Flat storage: models of different dimensions can share one file
+        vecs = np.split(data["vecs"], np.cumsum(data["lengths"])[:-1])
+        with self._lock:
+            for key, vec in zip(data["keys"], vecs):
+                self._entries[str(key)] = vec
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            keys = list(self._entries)
+            vecs = list(self._entries.values())
+        if not keys:
+            return
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so concurrent workers never leave a torn file
+        tmp = f"{self.path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp,
+            keys=np.array(keys),
+            vecs=np.concatenate(vecs),
+            lengths=np.array([len(v) for v in vecs]),
+        )
+        os.replace(tmp, self.path)
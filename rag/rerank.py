@@ -0,0 +1,78 @@
+import numpy as np
+import torch
+from sentence_transformers import CrossEncoder
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# Candidates fetched from the retriever per question before the cut
+DEFAULT_RERANK_FETCH = 20
+# Sigmoid relevance below which a chunk is not worth its prompt tokens
+DEFAULT_MIN_SCORE = 0.1
+
+
+def _passage(result: dict) -> str:
+    heading = result.get("heading") or ""
+    return f"{heading}\n{result.get('text') or ''}" if heading else result["text"]
+
+
+class CrossEncoderReranker:
+    """Re-scores retrieved chunks with a cross-encoder and keeps the best few.
+
+    Runs on CPU so it does not compete with vLLM for GPU memory; all
+    (question, chunk) pairs of a call go through the model in batches.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_RERANK_MODEL,
+        device: str = "cpu",
+        batch_size: int = 32,
+        max_length: int = 512,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = CrossEncoder(model_name, device=device, max_length=max_length)
+
+    def score_batch(
+        self, queries: list[str], results_lists: list[list[dict]]
+    ) -> list[np.ndarray]:
+        pairs = [(q, _passage(r)) for q, rs in zip(queries, results_lists) for r in rs]
+        if not pairs:
+            return [np.zeros(0, dtype="float32") for _ in queries]
+        scores = self.model.predict(
+            pairs,
+            batch_size=self.batch_size,
+            activation_fn=torch.nn.Sigmoid(),
+            show_progress_bar=False,
+        )
+        scores = np.asarray(scores, dtype="float32")
+        bounds = np.cumsum([0] + [len(rs) for rs in results_lists])
+        return [scores[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    def rerank_batch(
+        self,
+        queries: list[str],
+        results_lists: list[list[dict]],
+        top_k: int = 5,
+        min_score: float | None = DEFAULT_MIN_SCORE,
+        max_chars: int | None = None,
+    ) -> list[list[dict]]:
+        """Best-first chunks per question, cut at `top_k`, `min_score` and
+        `max_chars` of chunk text. The best chunk is always kept."""
+        out = []
+        for results, scores in zip(
+            results_lists, self.score_batch(queries, results_lists)
+        ):
+            kept, chars = [], 0
+            for j in np.argsort(-scores)[:top_k]:
+                size = len(_passage(results[j]))
+                if kept and min_score is not None and scores[j] < min_score:
+                    break
+                if kept and max_chars is not None and chars + size > max_chars:
+                    break
+                kept.append({**results[j], "rerank_score": float(scores[j])})
+                chars += size
+            out.append(kept)
+        return out
+
+    def rerank(self, query: str, results: list[dict], **kwargs) -> list[dict]:
+        return self.rerank_batch([query], [results], **kwargs)[0]
@@ -1,7 +1,30 @@
-import json
-import faiss
+from pathlib import Path
+
+import numpy as np
 
 from rag.bge import BGEEmbedder
+from rag.bm25 import BM25Index, is_identifier_query, rrf_fuse
+from rag.facets import FacetIndex
+from rag.meta_store import open_meta_store
+from rag.projection import Projection
+from rag.vector_index import (
+    QUANTIZED_TYPES,
+    SELECTOR_TYPES,
+    binarize,
+    load_calibration,
+    load_manifest,
+    read_index,
+    rerank,
+    search_params,
+    tuning_param,
+    value_for_budget,
+)
+
+MODES = ("dense", "lexical", "hybrid", "auto")
+# Candidates per result taken from each ranking before hybrid fusion
+HYBRID_FETCH = 4
+# Candidates per result the small cascade model passes on for re-scoring
+DEFAULT_CASCADE_FETCH = 10
 
 
 def format_context_from_results(results, k: int = 5, max_chars: int = 6000) -> str:
@@ -28,24 +51,310 @@ def format_context_from_results(results, k: int = 5, max_chars: int = 6000) -> s
 
 
 class Retriever:
-    def __init__(self, index_dir: str):
-        self.index = faiss.read_index(f"{index_dir}/index.faiss")
-        with open(f"{index_dir}/meta.json", encoding="utf-8") as f:
-            self.meta = json.load(f)
-        self.embedder = BGEEmbedder()
+    def __init__(
+        self,
+        index_dir: str,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        rerank_factor: int | None = None,
+        mmap: bool = False,
+        query_cache=None,
+        mode: str = "dense",
+        embedder: BGEEmbedder | None = None,
+        embed_backend: str = "torch",
+        embed_threads: int | None = None,
+        cascade_dir: str | None = None,
+        cascade_fetch: int = DEFAULT_CASCADE_FETCH,
+        cascade_embedder: BGEEmbedder | None = None,
+    ):
+        self.manifest = load_manifest(index_dir)
+        self.index_type = self.manifest["index_type"]
+        # mmap mode shares index pages across server workers through the page
+        # cache instead of copying them into each process; the block metadata
+        # store is always memory-mapped
+        self.index = read_index(f"{index_dir}/index.faiss", self.index_type, mmap=mmap)
+        self.meta = open_meta_store(index_dir)
+        self.embedder = embedder or BGEEmbedder(
+            self.manifest.get("model", "BAAI/bge-large-en"),
+            query_cache=query_cache,
+            backend=embed_backend,
+            threads=embed_threads,
+        )
+        self.version = self.manifest.get("version")
+        # Set when every chunk in the index comes from one docs release
+        self.default_ref = self.manifest.get("source_ref")
+
+        # Search-time recall knobs; per-request values override these
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.calibration = load_calibration(index_dir)
+
+        # Full-precision vectors, paged in from disk on demand: quantized
+        # indexes re-rank their compressed-code candidates against them, and
+        # filtered searches fall back to them when ANN returns too few hits
+        self.vectors = None
+        if (Path(index_dir) / "vectors.npy").exists():
+            self.vectors = np.load(Path(index_dir) / "vectors.npy", mmap_mode="r")
+        self.rerank_factor = None
+        if self.index_type in QUANTIZED_TYPES:
+            self.rerank_factor = rerank_factor or self.manifest.get("rerank_factor", 1)
+
+        # Reduced-dimension indexes map query embeddings the way the build
+        # mapped chunk embeddings
+        self.projection = (
+            Projection.load(index_dir) if Projection.exists(index_dir) else None
+        )
+
+        # Lexical index for identifier-heavy queries and hybrid fusion
+        self.bm25 = BM25Index.load(index_dir) if BM25Index.exists(index_dir) else None
+        self.mode = mode
+
+        # Per-facet id bitmaps for doc_type / breadcrumb / source_ref filters
+        self.facets = (
+            FacetIndex.load(index_dir) if FacetIndex.exists(index_dir) else None
+        )
+
+        # Two-tier dense search: a small-model index over the same chunks finds
+        # candidates, which are re-scored against this index's vectors
+        self.cascade = None
+        self.cascade_fetch = cascade_fetch
+        if cascade_dir is not None:
+            self.cascade = Retriever(
+                cascade_dir,
+                mmap=mmap,
+                query_cache=query_cache,
+                embedder=cascade_embedder,
+                embed_backend=embed_backend,
+                embed_threads=embed_threads,
+            )
+            self._check_cascade(index_dir, cascade_dir)
+
+    def _check_cascade(self, index_dir: str, cascade_dir: str):
+        if self.vectors is None:
+            raise ValueError(f"Cascade re-scoring needs {index_dir}/vectors.npy")
+        hashes = [
+            (Path(d) / load_manifest(d).get("chunk_hashes", "chunk_hashes.txt"))
+            for d in (index_dir, cascade_dir)
+        ]
+        if not all(h.exists() for h in hashes) or (
+            hashes[0].read_bytes() != hashes[1].read_bytes()
+        ):
+            raise ValueError(
+                f"{cascade_dir} does not index the same chunks as {index_dir}; "
+                "build both from the same chunk files"
+            )
+
+    def _search_params(
+        self,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        latency_budget_ms: float | None = None,
+        bitmap: np.ndarray | None = None,
+    ):
+        # Explicit values win, then the latency budget, then instance defaults
+        if nprobe is None and ef_search is None and latency_budget_ms is not None:
+            budget_value = value_for_budget(self.calibration, latency_budget_ms)
+            if tuning_param(self.index_type) == "nprobe":
+                nprobe = budget_value
+            elif tuning_param(self.index_type) == "ef_search":
+                ef_search = budget_value
+
+        return search_params(
+            self.index_type,
+            nprobe=nprobe or self.nprobe,
+            ef_search=ef_search or self.ef_search,
+            bitmap=bitmap,
+        )
+
+    def shard(self, ref: str | None = None) -> "Retriever":
+        """Same interface as ShardedRetriever.shard for a single-version index."""
+        if ref is not None and ref != self.default_ref:
+            available = [self.default_ref] if self.default_ref else []
+            raise KeyError(f"Unknown version {ref!r}; available: {available}")
+        return self
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.embedder.encode_query(query)
+
+    def resolve_mode(self, query: str, mode: str | None = None) -> str:
+        """dense, lexical or hybrid; `auto` answers identifier queries lexically."""
+        mode = mode or self.mode
+        if mode not in MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        if mode == "auto":
+            mode = "lexical" if is_identifier_query(query) else "dense"
+        if mode != "dense" and self.bm25 is None:
+            raise ValueError(f"{mode} retrieval needs bm25 files; rebuild the index")
+        return mode
+
+    def _dense_search(
+        self,
+        qvecs: np.ndarray,
+        k: int,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        latency_budget_ms: float | None = None,
+        bitmap: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if self.projection is not None:
+            qvecs = self.projection.apply(qvecs)
+        qvecs = np.ascontiguousarray(qvecs, dtype="float32").reshape(-1, self.index.d)
+        if bitmap is not None and self.index_type not in SELECTOR_TYPES:
+            # No id selector for this index: score the filtered rows exactly
+            scores = np.full((len(qvecs), k), -np.inf, dtype="float32")
+            idxs = np.full((len(qvecs), k), -1, dtype="int64")
+            return self._fill_filtered(qvecs, k, bitmap, scores, idxs)
+        params = self._search_params(nprobe, ef_search, latency_budget_ms, bitmap)
+
+        if self.rerank_factor is None:
+            scores, idxs = self.index.search(qvecs, k, params=params)
+        else:
+            codes = binarize(qvecs) if self.index_type == "binary" else qvecs
+            _, cand = self.index.search(codes, k * self.rerank_factor, params=params)
+            scores, idxs = rerank(self.vectors, qvecs, cand, k)
 
-    def search(self, query: str, k: int = 5):
-        qvec = self.embedder.encode_query(query)
-        scores, idxs = self.index.search(qvec.reshape(1, -1), k)
+        if bitmap is not None:
+            scores, idxs = self._fill_filtered(qvecs, k, bitmap, scores, idxs)
+        return scores, idxs
 
+    def _cascade_search(
+        self,
+        small_qvecs: np.ndarray,
+        qvecs: np.ndarray,
+        k: int,
+        bitmap: np.ndarray | None = None,
+        **params,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Small-model candidates, re-scored exactly with the large-model query."""
+        _, cand = self.cascade._dense_search(
+            small_qvecs, k * self.cascade_fetch, bitmap=bitmap, **params
+        )
+        if self.projection is not None:
+            qvecs = self.projection.apply(qvecs)
+        qvecs = np.ascontiguousarray(qvecs, dtype="float32").reshape(len(cand), -1)
+        return rerank(self.vectors, qvecs, cand, k)
+
+    def _fill_filtered(self, qvecs, k, bitmap, scores, idxs):
+        """Exact search over the filtered rows where ANN came back short of k.
+
+        IVF and HNSW only see filtered ids along their normal probe path, so a
+        narrow filter can leave fewer than k hits; PQ cannot filter at all and
+        always comes here. The subset is at most the whole corpus, so the
+        fallback never costs more than a flat scan.
+        """
+        if self.vectors is None:
+            return scores, idxs
+        allowed = self.facets.ids(bitmap)
+        want = min(k, len(allowed))
+        short = [r for r in range(len(qvecs)) if (idxs[r] >= 0).sum() < want]
+        if not short:
+            return scores, idxs
+
+        subset = np.asarray(self.vectors[allowed])
+        scores, idxs = scores.copy(), idxs.copy()
+        for r in short:
+            exact = subset @ qvecs[r]
+            top = np.argsort(-exact)[:want]
+            scores[r, :want], idxs[r, :want] = exact[top], allowed[top]
+        return scores, idxs
+
+    def _rows(self, scores, idxs, fields=None) -> list[dict]:
         return [
             {
-                **self.meta[i],
-                "score": float(scores[0][j]),
+                **self.meta.get(int(i), fields),
+                "score": float(scores[j]),
             }
-            for j, i in enumerate(idxs[0])
+            for j, i in enumerate(idxs)
+            if i >= 0
         ]
 
+    def search_vectors(
+        self, qvecs: np.ndarray, k: int = 5, fields=None, **params
+    ) -> list[list[dict]]:
+        """One FAISS search over a (n, dim) query matrix; one result list per row."""
+        scores, idxs = self._dense_search(qvecs, k, **params)
+        return [self._rows(s, i, fields) for s, i in zip(scores, idxs)]
+
+    def search(self, query: str, k: int = 5, qvec=None, **kwargs):
+        """Top-k chunks for `query`; `fields` limits which metadata is decoded.
+
+        Pass `qvec` when the query embedding is already known.
+        """
+        qvecs = None if qvec is None else np.asarray(qvec).reshape(1, -1)
+        return self.search_batch([query], k=k, qvecs=qvecs, **kwargs)[0]
+
+    def search_batch(
+        self,
+        queries: list[str],
+        k: int = 5,
+        mode: str | None = None,
+        qvecs: np.ndarray | None = None,
+        fields: list[str] | None = None,
+        filters: dict | None = None,
+        cascade_qvecs: np.ndarray | None = None,
+        **params,
+    ):
+        """search() for many queries: one batched encode, one FAISS search.
+
+        Lexical queries skip the embedding model entirely. With a cascade,
+        `cascade_qvecs` are the small-model embeddings, if already known. `filters` maps
+        doc_type / breadcrumb / source_ref to a value or list of values; hits
+        must match every given field.
+        """
+        if not queries:
+            return []
+
+        bitmap = mask = None
+        if filters and any(v is not None for v in filters.values()):
+            if self.facets is None:
+                raise ValueError("Filtered search needs facet files; rebuild the index")
+            bitmap = self.facets.bitmap(filters)
+            mask = self.facets.mask(bitmap)
+
+        modes = [self.resolve_mode(q, mode) for q in queries]
+        dense_rows = [i for i, m in enumerate(modes) if m != "lexical"]
+        fetch = k * HYBRID_FETCH if "hybrid" in modes else k
+
+        if dense_rows:
+            dense_queries = [queries[i] for i in dense_rows]
+            if qvecs is None:
+                dense_qvecs = self.embedder.encode_queries(dense_queries)
+            else:
+                dense_qvecs = np.asarray(qvecs)[dense_rows]
+            if self.cascade is None:
+                d_scores, d_idxs = self._dense_search(
+                    dense_qvecs, fetch, bitmap=bitmap, **params
+                )
+            else:
+                if cascade_qvecs is None:
+                    small_qvecs = self.cascade.embedder.encode_queries(dense_queries)
+                else:
+                    small_qvecs = np.asarray(cascade_qvecs)[dense_rows]
+                d_scores, d_idxs = self._cascade_search(
+                    small_qvecs, dense_qvecs, fetch, bitmap=bitmap, **params
+                )
+            row_of = {i: r for r, i in enumerate(dense_rows)}
+
+        results = []
+        for i, (query, m) in enumerate(zip(queries, modes)):
+            if m == "dense":
+                scores, idxs = d_scores[row_of[i]][:k], d_idxs[row_of[i]][:k]
+            elif m == "lexical":
+                scores, idxs = self.bm25.search(query, k, mask=mask)
+            else:
+                _, lexical = self.bm25.search(query, fetch, mask=mask)
+                scores, idxs = rrf_fuse([d_idxs[row_of[i]], lexical], k)
+            results.append(self._rows(scores, idxs, fields))
+        return results
+
     def search_and_format(self, query: str, k: int = 5, max_chars: int = 6000) -> str:
         results = self.search(query=query, k=k)
         return format_context_from_results(results=results, k=k, max_chars=max_chars)
+
+    def search_and_format_batch(
+        self, queries: list[str], k: int = 5, max_chars: int = 6000
+    ) -> list[str]:
+        return [
+            format_context_from_results(results=results, k=k, max_chars=max_chars)
+            for results in self.search_batch(queries, k=k)
+        ]
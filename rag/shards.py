@@ -0,0 +1,181 @@
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from rag.bge import BGEEmbedder
+from rag.retrieve import Retriever
+
+SHARDS = "shards.json"
+
+# Files a loaded shard keeps resident; vectors.npy and the metadata blocks are
+# memory-mapped and only touched for candidate rows, so they are not counted
+RESIDENT_FILES = (
+    "index.faiss",
+    "bm25.npz",
+    "bm25_vocab.json",
+    "facets.npy",
+    "projection.npz",
+)
+
+
+def ref_sort_key(ref: str):
+    """release-1.9 < release-1.10: compare the numbers in a ref numerically."""
+    return [int(p) if p.isdigit() else p for p in re.split(r"(\d+)", ref)]
+
+
+def shard_dir_name(ref: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", ref)
+
+
+def shard_bytes(index_dir) -> int:
+    return sum(
+        (Path(index_dir) / name).stat().st_size
+        for name in RESIDENT_FILES
+        if (Path(index_dir) / name).exists()
+    )
+
+
+def is_sharded(index_dir: str) -> bool:
+    return (Path(index_dir) / SHARDS).exists()
+
+
+def load_shards(index_dir: str) -> dict:
+    with open(Path(index_dir) / SHARDS, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_shards(index_dir: str, model: str, shards: dict[str, dict], default_ref=None):
+    """`shards` maps source_ref -> {"dir", "version", "num_vectors"}."""
+    version = hashlib.sha256(
+        "\n".join(f"{ref}={s['version']}" for ref, s in sorted(shards.items())).encode()
+    ).hexdigest()[:16]
+    data = {
+        "version": version,
+        "model": model,
+        "default_ref": default_ref or max(shards, key=ref_sort_key),
+        "shards": shards,
+    }
+    with open(Path(index_dir) / SHARDS, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+class ShardedRetriever:
+    """One Retriever per source_ref shard, loaded on first use.
+
+    Shards share one embedder and are kept in LRU order; once their resident
+    size passes `memory_cap_mb` the coldest are dropped, but the shard being
+    served always stays loaded.
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        memory_cap_mb: float | None = None,
+        query_cache=None,
+        embed_backend: str = "torch",
+        embed_threads: int | None = None,
+        cascade_dir: str | None = None,
+        **retriever_kwargs,
+    ):
+        self.index_dir = Path(index_dir)
+        self.manifest = load_shards(index_dir)
+        self.version = self.manifest["version"]
+        self.default_ref = self.manifest["default_ref"]
+        self.refs = sorted(self.manifest["shards"], key=ref_sort_key)
+        self.embedder = BGEEmbedder(
+            self.manifest["model"],
+            query_cache=query_cache,
+            backend=embed_backend,
+            threads=embed_threads,
+        )
+        # A cascade for a sharded index is itself sharded by the same refs;
+        # every shard pairs with its namesake and shares the small embedder
+        self.cascade_dir = Path(cascade_dir) if cascade_dir else None
+        self.cascade_embedder = None
+        if self.cascade_dir is not None:
+            cascade = load_shards(cascade_dir)
+            missing = set(self.manifest["shards"]) - set(cascade["shards"])
+            if missing:
+                raise ValueError(f"{cascade_dir} has no shards for {sorted(missing)}")
+            self._cascade_dirs = {
+                ref: str(self.cascade_dir / s["dir"])
+                for ref, s in cascade["shards"].items()
+            }
+            self.cascade_embedder = BGEEmbedder(
+                cascade["model"],
+                query_cache=query_cache,
+                backend=embed_backend,
+                threads=embed_threads,
+            )
+        self.memory_cap_bytes = memory_cap_mb * 1024 * 1024 if memory_cap_mb else None
+        self._kwargs = retriever_kwargs
+        self._loaded: OrderedDict[str, Retriever] = OrderedDict()
+        self._bytes: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def shard(self, ref: str | None = None) -> Retriever:
+        ref = ref or self.default_ref
+        if ref not in self.manifest["shards"]:
+            raise KeyError(f"Unknown version {ref!r}; available: {self.refs}")
+
+        with self._lock:
+            if ref in self._loaded:
+                self._loaded.move_to_end(ref)
+                return self._loaded[ref]
+
+            shard_dir = self.index_dir / self.manifest["shards"][ref]["dir"]
+            cascade = {}
+            if self.cascade_dir is not None:
+                cascade = {
+                    "cascade_dir": self._cascade_dirs[ref],
+                    "cascade_embedder": self.cascade_embedder,
+                }
+            retriever = Retriever(
+                str(shard_dir), embedder=self.embedder, **cascade, **self._kwargs
+            )
+            self._loaded[ref] = retriever
+            self._bytes[ref] = shard_bytes(shard_dir)
+            if cascade:
+                self._bytes[ref] += shard_bytes(cascade["cascade_dir"])
+            self.loads += 1
+            self._evict()
+            return retriever
+
+    def _evict(self):
+        if self.memory_cap_bytes is None:
+            return
+        while len(self._loaded) > 1 and self.memory_bytes() > self.memory_cap_bytes:
+            ref, _ = self._loaded.popitem(last=False)
+            del self._bytes[ref]
+            self.evictions += 1
+
+    def memory_bytes(self) -> int:
+        return sum(self._bytes.values())
+
+    def search(self, query: str, k: int = 5, ref: str | None = None, **kwargs):
+        return self.shard(ref).search(query, k=k, **kwargs)
+
+    def search_batch(self, queries: list[str], ref: str | None = None, **kwargs):
+        return self.shard(ref).search_batch(queries, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "refs": self.refs,
+            "default_ref": self.default_ref,
+            "loaded": list(self._loaded),
+            "resident_mb": round(self.memory_bytes() / 1024 / 1024, 1),
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+
+def open_retriever(index_dir: str, memory_cap_mb: float | None = None, **kwargs):
+    """ShardedRetriever for a `--shard-by-ref` build, else a plain Retriever."""
+    if is_sharded(index_dir):
+        return ShardedRetriever(index_dir, memory_cap_mb=memory_cap_mb, **kwargs)
+    return Retriever(index_dir, **kwargs)
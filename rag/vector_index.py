@@ -0,0 +1,216 @@
+import json
+import math
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "sq8", "fp16", "pq", "binary")
+# Compressed first stage; final scores come from exact re-ranking
+QUANTIZED_TYPES = ("sq8", "fp16", "pq", "binary")
+# Types that learn centroids or codebooks from the data before adding it
+TRAINED_TYPES = ("ivf", "sq8", "fp16", "pq")
+# Types whose search takes an id selector; IndexPQ rejects SearchParameters
+SELECTOR_TYPES = ("flat", "ivf", "hnsw", "sq8", "fp16", "binary")
+
+MANIFEST = "manifest.json"
+CALIBRATION = "calibration.json"
+
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+DEFAULT_PQ_M = 64
+DEFAULT_RERANK_FACTOR = {"sq8": 2, "fp16": 2, "pq": 8, "binary": 16}
+
+
+def default_nlist(n: int) -> int:
+    """~4*sqrt(N) lists, capped so every list gets at least 39 training points."""
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def empty_index(
+    dim: int,
+    index_type: str = "flat",
+    num_vectors: int = 0,
+    nlist: int | None = None,
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+    pq_m: int = DEFAULT_PQ_M,
+):
+    """Unpopulated index; TRAINED_TYPES need train() before vectors are added."""
+    if index_type == "binary":
+        return faiss.IndexBinaryFlat(dim)
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+    if index_type == "ivf":
+        quantizer = faiss.IndexFlatIP(dim)
+        return faiss.IndexIVFFlat(
+            quantizer,
+            dim,
+            nlist or default_nlist(num_vectors),
+            faiss.METRIC_INNER_PRODUCT,
+        )
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+        return index
+    if index_type in ("sq8", "fp16"):
+        qtype = {
+            "sq8": faiss.ScalarQuantizer.QT_8bit,
+            "fp16": faiss.ScalarQuantizer.QT_fp16,
+        }[index_type]
+        return faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "pq":
+        return faiss.IndexPQ(dim, pq_m, 8, faiss.METRIC_INNER_PRODUCT)
+    raise ValueError(f"Unknown index type: {index_type}")
+
+
+def add_vectors(index, index_type: str, vectors: np.ndarray):
+    index.add(binarize(vectors) if index_type == "binary" else vectors)
+
+
+def create_index(
+    vectors: np.ndarray,
+    index_type: str = "flat",
+    nlist: int | None = None,
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+    pq_m: int = DEFAULT_PQ_M,
+):
+    index = empty_index(
+        vectors.shape[1],
+        index_type,
+        len(vectors),
+        nlist=nlist,
+        hnsw_m=hnsw_m,
+        ef_construction=ef_construction,
+        pq_m=pq_m,
+    )
+    if index_type in TRAINED_TYPES:
+        index.train(vectors)
+    add_vectors(index, index_type, vectors)
+    return index
+
+
+def binarize(vectors: np.ndarray) -> np.ndarray:
+    """Sign-bit hash: one bit per dimension, packed into dim/8 bytes."""
+    return np.packbits(vectors > 0, axis=1)
+
+
+def write_index(index, path: str, index_type: str):
+    if index_type == "binary":
+        faiss.write_index_binary(index, path)
+    else:
+        faiss.write_index(index, path)
+
+
+def mmap_flags(index_type: str) -> int:
+    """Read-only mmap flags: IVF maps its inverted lists, the rest their flat codes."""
+    if index_type == "ivf":
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+
+def read_index(path: str, index_type: str, mmap: bool = False):
+    flags = mmap_flags(index_type) if mmap else 0
+    if index_type == "binary":
+        return faiss.read_index_binary(path, flags)
+    return faiss.read_index(path, flags)
+
+
+def index_params(index) -> dict:
+    """Build-time parameters worth recording next to the index."""
+    if isinstance(index, faiss.IndexPQ):
+        return {"pq_m": index.pq.M}
+    if isinstance(index, faiss.IndexIVF):
+        return {"nlist": index.nlist}
+    if isinstance(index, faiss.IndexHNSW):
+        return {
+            "hnsw_m": index.hnsw.nb_neighbors(1),
+            "ef_construction": index.hnsw.efConstruction,
+        }
+    return {}
+
+
+def search_params(
+    index_type: str,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+    bitmap: np.ndarray | None = None,
+):
+    """Per-call FAISS search parameters, so concurrent searches never mutate the index.
+
+    `bitmap` (little-endian packed ids) restricts the search to those rows;
+    only SELECTOR_TYPES accept it.
+    """
+    kwargs = {}
+    if bitmap is not None:
+        if index_type not in SELECTOR_TYPES:
+            raise ValueError(f"{index_type} indexes cannot filter during search")
+        kwargs["sel"] = faiss.IDSelectorBitmap(bitmap)
+    if index_type == "ivf":
+        return faiss.SearchParametersIVF(nprobe=nprobe or DEFAULT_NPROBE, **kwargs)
+    if index_type == "hnsw":
+        return faiss.SearchParametersHNSW(
+            efSearch=ef_search or DEFAULT_EF_SEARCH, **kwargs
+        )
+    if kwargs:
+        return faiss.SearchParameters(**kwargs)
+    return None
+
+
+def rerank(
+    vectors: np.ndarray, qvecs: np.ndarray, idxs: np.ndarray, k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Re-score first-stage candidates against full-precision vectors, keep top-k.
+
+    `vectors` is usually the memory-mapped vectors.npy, so only candidate rows
+    are paged in.
+    """
+    scores = np.full((len(qvecs), k), -np.inf, dtype="float32")
+    out = np.full((len(qvecs), k), -1, dtype="int64")
+    for row, (q, cand) in enumerate(zip(qvecs, idxs)):
+        cand = cand[cand >= 0]
+        if len(cand) == 0:
+            continue
+        # Fancy indexing on a memmap wants sorted ids for sequential reads
+        cand = np.unique(cand)
+        exact = np.asarray(vectors[cand]) @ q
+        top = np.argsort(-exact)[:k]
+        scores[row, : len(top)] = exact[top]
+        out[row, : len(top)] = cand[top]
+    return scores, out
+
+
+def tuning_param(index_type: str) -> str | None:
+    return {"ivf": "nprobe", "hnsw": "ef_search"}.get(index_type)
+
+
+def load_manifest(index_dir: str) -> dict:
+    path = Path(index_dir) / MANIFEST
+    if not path.exists():
+        # Indexes built before the manifest existed are always flat
+        return {"index_type": "flat"}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(index_dir: str, manifest: dict):
+    with open(Path(index_dir) / MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load_calibration(index_dir: str) -> list[dict]:
+    """Latency/recall points written by bench.bench_ann, sorted by tuning value."""
+    path = Path(index_dir) / CALIBRATION
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        return sorted(json.load(f)["points"], key=lambda p: p["value"])
+
+
+def value_for_budget(points: list[dict], latency_budget_ms: float) -> int | None:
+    """Largest calibrated nprobe/efSearch whose measured latency fits the budget."""
+    if not points:
+        return None
+    fitting = [p for p in points if p["latency_ms"] <= latency_budget_ms]
+    return (fitting[-1] if fitting else points[0])["value"]
@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+from starlette.requests import ClientDisconnect
+
+from app.admission import AdmissionController, Overloaded, SlotStreamingResponse
+
+
+def test_acquire_release():
+    async def run():
+        ctl = AdmissionController(max_in_flight=2, max_queue=4)
+        await ctl.acquire(1)
+        await ctl.acquire(1)
+        assert ctl.in_flight == 2
+        ctl.release(0.01)
+        ctl.release(0.01)
+        assert ctl.in_flight == 0
+        assert ctl.stats()["admitted"] == 2
+
+    asyncio.run(run())
+
+
+def test_release_hands_slot_to_oldest_waiter():
+    async def run():
+        ctl = AdmissionController(max_in_flight=1, max_queue=4)
+        await ctl.acquire(1)
+        order = []
+
+        async def wait(name):
+            await ctl.acquire(1)
+            order.append(name)
+
+        waiters = [asyncio.create_task(wait(n)) for n in "ab"]
+        await asyncio.sleep(0)
+        assert ctl.stats()["queue_depth"] == 2
+        ctl.release()
+        await asyncio.sleep(0)
+        ctl.release()
+        await asyncio.gather(*waiters)
+        assert order == ["a", "b"]
+        assert ctl.in_flight == 1
+        ctl.release()
+        assert ctl.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_queue_full_and_timeout_are_shed():
+    async def run():
+        ctl = AdmissionController(max_in_flight=1, max_queue=1)
+        await ctl.acquire(1)
+        queued = asyncio.create_task(ctl.acquire(0.05))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as e:
+            await ctl.acquire(1)
+        assert e.value.reason == "queue_full"
+        with pytest.raises(Overloaded) as e:
+            await queued
+        assert e.value.reason == "deadline"
+        assert ctl.stats()["shed"] == {"queue_full": 1, "deadline": 1}
+        assert ctl.stats()["queue_depth"] == 0
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def run():
+        ctl = AdmissionController(max_in_flight=1, max_queue=4)
+        await ctl.acquire(1)
+        waiter = asyncio.create_task(ctl.acquire(1))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert ctl.stats()["queue_depth"] == 0
+        ctl.release()
+        assert ctl.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_cancel_after_handover_gives_slot_back():
+    async def run():
+        ctl = AdmissionController(max_in_flight=1, max_queue=4)
+        await ctl.acquire(1)
+        waiter = asyncio.create_task(ctl.acquire(1))
+        await asyncio.sleep(0)
+        # The slot is handed over, then the waiter is cancelled before it runs
+        ctl.release()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert ctl.in_flight == 0
+
+    asyncio.run(run())
+
+
+async def _held_stream(ctl, started):
+    await ctl.acquire(1)
+
+    async def events():
+        started.append(True)
+        while True:
+            yield b"{}\n"
+            await asyncio.sleep(0.01)
+
+    return SlotStreamingResponse(events(), ctl.release)
+
+
+@pytest.mark.parametrize("spec_version", ["2.3", "2.4"])
+def test_stream_disconnect_before_body_releases_slot(spec_version):
+    async def run():
+        ctl = AdmissionController(max_in_flight=1, max_queue=1)
+        started = []
+        response = await _held_stream(ctl, started)
+        assert ctl.in_flight == 1
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            raise OSError("client went away")
+
+        scope = {"type": "http", "asgi": {"spec_version": spec_version}}
+        try:
+            await response(scope, receive, send)
+        except (OSError, ClientDisconnect):
+            pass
+        assert not started
+        assert ctl.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_stream_release_is_idempotent():
+    async def run():
+        ctl = AdmissionController(max_in_flight=1, max_queue=1)
+        response = await _held_stream(ctl, [])
+        # Early release from the body generator, then again at response end
+        response.release()
+        response.release()
+        assert ctl.in_flight == 0
+        await ctl.acquire(1)
+        assert ctl.in_flight == 1
+
+    asyncio.run(run())
@@ -0,0 +1,74 @@
+import app.answer_cache as answer_cache_module
+from app.answer_cache import AnswerCache, QueryLog, answer_key
+
+SOURCES = [{"heading": "Pods", "url": "https://k8s.io/docs/pods/"}]
+
+
+def test_round_trip_survives_reopen(tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    key = answer_key("what is a pod", 5, "v1")
+    cache = AnswerCache(path)
+    assert cache.get(key) is None
+    cache.put(key, "What is a Pod?", "A Pod is ...", SOURCES)
+    cache.close()
+
+    cache = AnswerCache(path)
+    assert key in cache
+    assert cache.get(key) == {"answer": "A Pod is ...", "sources": SOURCES}
+    assert cache.stats()["hits"] == 1
+    assert answer_key("what is a pod", 5, "v2") not in cache
+    cache.close()
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"), max_mb=0.001)
+    for i in range(3):
+        cache.put(str(i), "q", "x" * 300, [])
+    # Reading "0" makes "1" the least recently used
+    cache.get("0")
+    cache.put("3", "q", "x" * 300, [])
+    assert "1" not in cache
+    assert "0" in cache and "3" in cache
+    assert cache.stats()["evictions"] >= 1
+
+
+def test_hit_times_are_flushed_without_stores(tmp_path, monkeypatch):
+    monkeypatch.setattr(answer_cache_module, "_MAX_TOUCHED", 2)
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"))
+    for key in "ab":
+        cache.put(key, "q", "answer", [])
+    for key in "aab":
+        cache.get(key)
+    assert len(cache._touched) < 2
+
+
+def test_query_log_rotates_and_reads_both_files(tmp_path):
+    path = str(tmp_path / "query_log.jsonl")
+    log = QueryLog(path, max_mb=0.0002)
+    for q in ["a", "b", "a", "a", "c", "b"]:
+        log.append({"question": q, "pad": "x" * 40})
+    assert (tmp_path / "query_log.jsonl.1").exists()
+    assert (tmp_path / "query_log.jsonl").stat().st_size <= log.max_bytes
+    hot, skipped = log.most_frequent(2, key=lambda r: r["question"])
+    assert [r["question"] for r in hot] == ["a", "b"]
+    assert skipped == 0
+    log.close()
+
+
+def test_query_log_skips_bad_lines(tmp_path):
+    path = tmp_path / "query_log.jsonl"
+    log = QueryLog(str(path))
+    log.append({"question": "a"})
+    log.append({"q": "old schema"})
+    log.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('[1, 2]\n{"question": "cut sho')
+
+    def key(request):
+        if "question" not in request:
+            raise ValueError("old schema")
+        return request["question"]
+
+    hot, skipped = QueryLog(str(path)).most_frequent(5, key=key)
+    assert hot == [{"question": "a"}]
+    assert skipped == 3
@@ -0,0 +1,56 @@
+import asyncio
+
+from app.batcher import MicroBatcher, run_isolated
+
+
+def _halve(items: list[int]) -> list:
+    return run_isolated(
+        list(range(len(items))), lambda rows: [_check(items[i]) for i in rows]
+    )
+
+
+def _check(x: int) -> float:
+    if x <= 0:
+        raise ValueError(f"bad item {x}")
+    return x / 2
+
+
+def test_run_isolated_only_fails_bad_rows():
+    out = run_isolated([0, 1, 2], lambda rows: [_check([4, 0, 6][i]) for i in rows])
+    assert out[0] == 2 and out[2] == 3
+    assert isinstance(out[1], ValueError)
+
+
+def test_failing_item_fails_only_its_own_call():
+    async def run():
+        batcher = MicroBatcher(_halve, max_batch=8, max_wait_ms=20)
+        batcher.start()
+        try:
+            out = await asyncio.gather(
+                *(batcher.submit(x) for x in (2, 0, 8)), return_exceptions=True
+            )
+        finally:
+            await batcher.stop()
+        assert out[0] == 1 and out[2] == 4
+        assert isinstance(out[1], ValueError)
+        assert batcher.stats()["batches"] == 1
+
+    asyncio.run(run())
+
+
+def test_raising_batch_fails_every_call():
+    def broken(items):
+        raise RuntimeError("executor down")
+
+    async def run():
+        batcher = MicroBatcher(broken, max_wait_ms=20)
+        batcher.start()
+        try:
+            out = await asyncio.gather(
+                *(batcher.submit(x) for x in range(2)), return_exceptions=True
+            )
+        finally:
+            await batcher.stop()
+        assert all(isinstance(e, RuntimeError) for e in out)
+
+    asyncio.run(run())
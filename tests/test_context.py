@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip("transformers")
+
+from rag.context import MIN_PARTIAL_TOKENS, SEPARATOR, ContextPacker
+
+
+class CharTokenizer:
+    """One token per character, so budgets are easy to reason about."""
+
+    def encode(self, text, add_special_tokens=False):
+        return [ord(c) for c in text]
+
+    def decode(self, ids):
+        return "".join(chr(i) for i in ids)
+
+
+def _packer(**kwargs) -> ContextPacker:
+    return ContextPacker(tokenizer=CharTokenizer(), **kwargs)
+
+
+def _chunk(i: int, text: str, url: str | None = None) -> dict:
+    return {"chunk_id": f"c{i}", "text": text, "url": url or f"u{i}"}
+
+
+def test_everything_fits_in_rank_order():
+    results = [_chunk(2, "b" * 50), _chunk(1, "a" * 50)]
+    context = _packer().pack(results, budget=102)
+    assert context == "b" * 50 + SEPARATOR + "a" * 50
+
+
+def test_last_part_is_cut_to_the_budget():
+    results = [_chunk(1, "a" * 50), _chunk(2, "b" * 100)]
+    budget = 50 + len(SEPARATOR) + MIN_PARTIAL_TOKENS
+    context = _packer().pack(results, budget=budget)
+    assert context == "a" * 50 + SEPARATOR + "b" * MIN_PARTIAL_TOKENS
+
+
+def test_short_remainder_is_left_out():
+    results = [_chunk(1, "a" * 50), _chunk(2, "b" * 100)]
+    budget = 50 + len(SEPARATOR) + MIN_PARTIAL_TOKENS - 1
+    assert _packer().pack(results, budget=budget) == "a" * 50
+
+
+def test_first_part_alone_is_cut():
+    assert _packer().pack([_chunk(1, "a" * 100)], budget=40) == "a" * 40
+
+
+@pytest.mark.parametrize("budget", [0, MIN_PARTIAL_TOKENS - 1])
+def test_tiny_budget_gives_empty_context(budget):
+    assert _packer().pack([_chunk(1, "a" * 100)], budget=budget) == ""
+
+
+def test_duplicates_are_dropped():
+    results = [_chunk(1, "a" * 40), _chunk(2, "a" * 40), _chunk(3, "a" * 20)]
+    assert _packer().pack(results, budget=1000) == "a" * 40
+
+
+def test_canonical_orders_by_chunk_id():
+    results = [_chunk(3, "c" * 10), _chunk(1, "a" * 10), _chunk(2, "b" * 10)]
+    context = _packer().pack(results, budget=1000, canonical=True)
+    assert context == SEPARATOR.join(["a" * 10, "b" * 10, "c" * 10])
+
+
+def test_cache_holds_counts():
+    packer = _packer()
+    packer.pack([_chunk(1, "a" * 100)], budget=1000)
+    assert packer.count("a" * 100) == 100
+    assert packer._count.cache_info().hits >= 1
@@ -0,0 +1,50 @@
+import json
+import sys
+
+from ingest import dedup
+from rag.facets import FacetIndex
+
+BOILERPLATE = (
+    "Before you begin you need to have a Kubernetes cluster, and the kubectl "
+    "command-line tool must be configured to communicate with your cluster."
+)
+
+
+def _run(tmp_path, monkeypatch, chunks: list[dict]) -> list[dict]:
+    src, out = tmp_path / "chunks.jsonl", tmp_path / "dedup.jsonl"
+    src.write_text("".join(json.dumps(c) + "\n" for c in chunks))
+    argv = ["dedup", "--chunks", str(src), "--out", str(out)]
+    monkeypatch.setattr(sys, "argv", argv + ["--report", str(tmp_path / "r.json")])
+    dedup.main()
+    return [json.loads(line) for line in out.read_text().splitlines()]
+
+
+def test_collapsed_chunk_keeps_member_facets(tmp_path, monkeypatch):
+    chunks = [
+        {
+            "text": BOILERPLATE,
+            "url": "https://k8s.io/docs/tasks/a/",
+            "doc_type": "task",
+            "breadcrumb": ["Tasks", "Run Applications"],
+        },
+        {
+            "text": BOILERPLATE,
+            "url": "https://k8s.io/docs/tutorials/b/",
+            "doc_type": "tutorial",
+            "breadcrumb": ["Tutorials"],
+        },
+        {"text": "A Pod is the smallest deployable unit.", "doc_type": "concept"},
+    ]
+    out = _run(tmp_path, monkeypatch, chunks)
+    assert len(out) == 2
+    assert out[0]["doc_type"] == "task"
+    assert out[0]["urls"] == [chunks[0]["url"], chunks[1]["url"]]
+    assert out[0]["member_facets"] == [
+        {"doc_type": "tutorial", "breadcrumb": ["Tutorials"]}
+    ]
+    assert "member_facets" not in out[1]
+
+    facets = FacetIndex.build(out)
+    for filters in ({"doc_type": "tutorial"}, {"breadcrumb": "Tutorials"}):
+        assert list(facets.ids(facets.bitmap(filters))) == [0]
+    assert list(facets.ids(facets.bitmap({"doc_type": "task"}))) == [0]
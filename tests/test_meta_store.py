@@ -0,0 +1,27 @@
+from rag.meta_store import BlockMetaStore, write_block_meta
+
+
+def test_round_trip(tmp_path):
+    rows = [
+        {"chunk_id": f"c{i}", "text": f"chunk {i}", "urls": [f"u{i}"]}
+        for i in range(10)
+    ]
+    write_block_meta(tmp_path, rows, block_size=4)
+    store = BlockMetaStore(tmp_path)
+    assert len(store) == 10
+    assert [store[i] for i in range(10)] == rows
+    assert store.get(9, ["text"]) == {"text": "chunk 9"}
+
+
+def test_fields_are_the_union_of_all_rows(tmp_path):
+    rows = [{"chunk_id": f"c{i}"} for i in range(5)]
+    # A field that first shows up in a later block, and one in the last block
+    rows[4]["urls"] = ["a", "b"]
+    rows.append({"chunk_id": "c5", "heading": "Pods"})
+    write_block_meta(tmp_path, rows, block_size=2)
+    store = BlockMetaStore(tmp_path)
+    assert store.fields == ["chunk_id", "urls", "heading"]
+    assert store[0] == {"chunk_id": "c0", "urls": None, "heading": None}
+    assert store[4]["urls"] == ["a", "b"]
+    assert store[5]["heading"] == "Pods"
+    assert store.get(1, ["heading"]) == {"heading": None}
@@ -0,0 +1,30 @@
+import numpy as np
+
+from rag.query_cache import QueryEmbeddingCache
+
+
+def test_save_load_round_trip(tmp_path):
+    path = str(tmp_path / "q.npz")
+    cache = QueryEmbeddingCache(path=path)
+    cache.put("small", "What is a Pod?", np.ones(4))
+    cache.put("large", "what is a pod", np.ones(8))
+    cache.save()
+
+    loaded = QueryEmbeddingCache(path=path)
+    assert loaded.get("small", "what is a pod").shape == (4,)
+    assert loaded.get("large", "What is a Pod?").shape == (8,)
+
+
+def test_drop_mismatched_keeps_other_models(tmp_path):
+    path = str(tmp_path / "q.npz")
+    cache = QueryEmbeddingCache(path=path)
+    cache.put("model", "a", np.ones(4))
+    cache.put("model", "b", np.ones(8))
+    cache.put("other", "a", np.ones(4))
+    cache.save()
+
+    loaded = QueryEmbeddingCache(path=path)
+    assert loaded.drop_mismatched("model", 8) == 1
+    assert loaded.get("model", "a") is None
+    assert loaded.get("model", "b") is not None
+    assert loaded.get("other", "a") is not None
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from rag.facets import FacetIndex
+from rag.meta_store import write_block_meta
+from rag.retrieve import Retriever
+from rag.vector_index import (
+    DEFAULT_RERANK_FACTOR,
+    INDEX_TYPES,
+    create_index,
+    write_index,
+    write_manifest,
+)
+
+N = 512
+
+
+def _vectors(n: int, dim: int = 32, seed: int = 0) -> np.ndarray:
+    x = np.random.default_rng(seed).standard_normal((n, dim)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def _doc_type(i: int) -> str:
+    return "tutorial" if i % 25 == 0 else ("concept", "task")[i % 2]
+
+
+@pytest.fixture(params=INDEX_TYPES)
+def retriever(request, tmp_path):
+    index_type = request.param
+    vectors = _vectors(N)
+    np.save(tmp_path / "vectors.npy", vectors)
+    write_index(
+        create_index(vectors, index_type, pq_m=8),
+        str(tmp_path / "index.faiss"),
+        index_type,
+    )
+    chunks = [
+        {"chunk_id": f"c{i:04d}", "text": f"chunk {i}", "doc_type": _doc_type(i)}
+        for i in range(N)
+    ]
+    write_block_meta(tmp_path, chunks)
+    FacetIndex.build(chunks).save(tmp_path)
+    write_manifest(
+        tmp_path,
+        {
+            "index_type": index_type,
+            "rerank_factor": DEFAULT_RERANK_FACTOR.get(index_type),
+        },
+    )
+    # Queries are given as vectors, so the embedder is never called
+    return Retriever(str(tmp_path), embedder=object())
+
+
+def test_filtered_search_every_index_type(retriever):
+    bitmap = retriever.facets.bitmap({"doc_type": "tutorial"})
+    queries = _vectors(3, seed=1)
+    results = retriever.search_vectors(queries, k=5, bitmap=bitmap)
+
+    allowed = np.flatnonzero([_doc_type(i) == "tutorial" for i in range(N)])
+    subset = _vectors(N)[allowed]
+    for q, rows in zip(queries, results):
+        assert len(rows) == 5
+        assert all(r["doc_type"] == "tutorial" for r in rows)
+        if retriever.index_type in ("flat", "pq"):
+            exact = allowed[np.argsort(-(subset @ q))[:5]]
+            assert [r["chunk_id"] for r in rows] == [f"c{i:04d}" for i in exact]
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_run():
+    async def run():
+        sf, calls = SingleFlight(), []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        out = await asyncio.gather(*(sf.do("k", work) for _ in range(3)))
+        assert out == [("answer", False), ("answer", True), ("answer", True)]
+        assert len(calls) == 1
+        assert sf.stats()["max_waiters"] == 3
+        # The key is forgotten once done, so the next call runs fresh
+        assert await sf.do("k", work) == ("answer", False)
+        assert len(calls) == 2
+
+    asyncio.run(run())
+
+
+def test_error_reaches_every_waiter():
+    async def run():
+        sf = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("vLLM down")
+
+        out = await asyncio.gather(
+            *(sf.do("k", fail) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(e, RuntimeError) for e in out)
+        assert sf.stats()["in_flight"] == 0
+
+    asyncio.run(run())
+
+
+def test_last_waiter_timing_out_cancels_work():
+    async def run():
+        sf, cancelled = SingleFlight(), asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(sf.do("k", slow), 0.01)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert sf.stats()["abandoned"] == 1
+        assert sf.stats()["in_flight"] == 0
+
+    asyncio.run(run())
+
+
+def test_work_continues_while_others_wait():
+    async def run():
+        sf = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        patient = asyncio.ensure_future(sf.do("k", work))
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(sf.do("k", work), 0.01)
+        assert await patient == ("answer", False)
+        assert sf.stats()["abandoned"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from rag.vector_index import (
+    INDEX_TYPES,
+    SELECTOR_TYPES,
+    binarize,
+    create_index,
+    search_params,
+)
+
+
+def _vectors(n: int, dim: int = 32, seed: int = 0) -> np.ndarray:
+    x = np.random.default_rng(seed).standard_normal((n, dim)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_filtered_search(index_type):
+    vectors = _vectors(512)
+    allowed = np.arange(0, len(vectors), 7)
+    mask = np.zeros(len(vectors), dtype=bool)
+    mask[allowed] = True
+    bitmap = np.packbits(mask, bitorder="little")
+
+    index = create_index(vectors, index_type, pq_m=8)
+    if index_type not in SELECTOR_TYPES:
+        with pytest.raises(ValueError):
+            search_params(index_type, bitmap=bitmap)
+        return
+
+    queries = _vectors(4, seed=1)
+    codes = binarize(queries) if index_type == "binary" else queries
+    _, idxs = index.search(codes, 10, params=search_params(index_type, bitmap=bitmap))
+    hits = idxs[idxs >= 0]
+    assert len(hits)
+    assert np.isin(hits, allowed).all()